@@ -1,26 +1,33 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
+import numpy as np
 from datetime import datetime, timedelta
 import requests
 from io import BytesIO
 import json
 import os
-import sys
-import subprocess
-import firebase_admin
-import streamlit.components.v1 as components
-from firebase_admin import credentials, firestore
-
-# --- AUTO-INSTALLER BLOCK ---
-# This forces installation into the CURRENT Python environment
+import bisect
+import hashlib
+import shutil
+import html
+import random
+import threading
+import time
+import importlib.util
+import sqlite3
+from collections import OrderedDict
+from contextlib import closing, contextmanager, nullcontext
 try:
-    from streamlit_autorefresh import st_autorefresh
+    import fcntl
 except ImportError:
-    # If the import fails, install it immediately using the current python executable
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "streamlit-autorefresh"])
-    from streamlit_autorefresh import st_autorefresh
-# ---------------------------
+    fcntl = None
+import streamlit.components.v1 as components
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+# Plotly and firebase_admin are imported where they are used (chart rendering, Firestore
+# access), so the login view and cold starts don't pay for them. pandas imports openpyxl
+# itself, only when a workbook is actually parsed with it.
 
 # ================= PAGE CONFIG =================
 st.set_page_config(
@@ -30,8 +37,26 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# 🔄 AUTO-REFRESH: Runs every 15 minutes
-st_autorefresh(interval=15 * 60 * 1000, key="datarefresh")
+# ================= DEPENDENCY CHECK =================
+# Checked once per process with find_spec (no imports). Install from requirements.txt;
+# nothing is pip-installed at runtime.
+REQUIRED_MODULES = {"plotly": "plotly", "firebase_admin": "firebase-admin", "openpyxl": "openpyxl"}
+
+@st.cache_resource
+def check_dependencies():
+    missing = [pkg for mod, pkg in REQUIRED_MODULES.items() if importlib.util.find_spec(mod) is None]
+    has_autorefresh = importlib.util.find_spec("streamlit_autorefresh") is not None
+    return missing, has_autorefresh
+
+missing_packages, has_autorefresh = check_dependencies()
+if missing_packages:
+    st.error(f"❌ Missing packages: {', '.join(missing_packages)}. Run `pip install -r requirements.txt`.")
+    st.stop()
+
+# 🔄 AUTO-REFRESH: Runs every 15 minutes (skipped if streamlit-autorefresh isn't installed)
+if has_autorefresh:
+    from streamlit_autorefresh import st_autorefresh
+    st_autorefresh(interval=15 * 60 * 1000, key="datarefresh")
 # ================= CONFIGURATION MANAGEMENT =================
 # Default URLs (Fallbacks)
 DEFAULT_URLS = {
@@ -56,49 +81,159 @@ DEFAULT_URLS = {
 @st.cache_resource
 def get_db():
     try:
-        if not firebase_admin._apps:
-            # 1. Try to load from Streamlit Cloud Secrets (for the website)
-            if "firebase" in st.secrets:
-                key_dict = dict(st.secrets["firebase"])
-                cred = credentials.Certificate(key_dict)
-            
-            # 2. Fallback: Try to load from local file (for your VS Code testing)
-            elif os.path.exists("firebase_key.json"):
-                cred = credentials.Certificate("firebase_key.json")
-            
-            else:
-                st.error("❌ Firebase Key not found. Please check Secrets on Streamlit Cloud.")
-                return None
+        # The key is looked up before importing firebase_admin, so runs without one never load it
+        # 1. Try to load from Streamlit Cloud Secrets (for the website)
+        if "firebase" in st.secrets:
+            key = dict(st.secrets["firebase"])
+
+        # 2. Fallback: Try to load from local file (for your VS Code testing)
+        elif os.path.exists("firebase_key.json"):
+            key = "firebase_key.json"
+
+        else:
+            st.error("❌ Firebase Key not found. Please check Secrets on Streamlit Cloud.")
+            return None
 
-            firebase_admin.initialize_app(cred)
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(key))
         return firestore.client()
     except Exception as e:
         st.error(f"Firebase Error: {e}")
         return None
 
-def load_config():
-    """Load URLs from Firebase Firestore."""
+# The unit config is cached per process and kept current by a Firestore snapshot listener,
+# so reruns don't pay a Firestore round trip. The last good copy is also kept on disk.
+CONFIG_TTL_SEC = int(os.environ.get("FCR_CONFIG_TTL", "600"))
+CONFIG_TIMEOUT_SEC = float(os.environ.get("FCR_CONFIG_TIMEOUT", "3"))
+LOCAL_CONFIG_PATH = os.path.join(".fcr_cache", "unit_config.json")
+
+def read_local_config():
     try:
-        db = get_db()
-        if db:
-            doc_ref = db.collection("settings").document("unit_config")
-            doc = doc_ref.get()
-            if doc.exists:
-                return doc.to_dict()
-            else:
-                save_config(DEFAULT_URLS)
-                return DEFAULT_URLS
+        with open(LOCAL_CONFIG_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_local_config(data):
+    try:
+        os.makedirs(os.path.dirname(LOCAL_CONFIG_PATH), exist_ok=True)
+        tmp_path = f"{LOCAL_CONFIG_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, LOCAL_CONFIG_PATH)
+    except OSError:
+        pass
+
+@st.cache_resource
+def get_config_store():
+    return {
+        "lock": threading.Lock(),
+        "data": read_local_config() or DEFAULT_URLS,
+        "version": 0,
+        "checked_at": None,
+        "listener": None,
+    }
+
+def apply_config(store, data):
+    """Swap in a new config for every session in this process."""
+    with store["lock"]:
+        store["data"] = data
+        store["version"] += 1
+        store["checked_at"] = datetime.now()
+    write_local_config(data)
+
+# One Firestore document per unit (id = unit name, "order" keeps the display order).
+# The old single settings/unit_config document is migrated on first read.
+UNITS_COLLECTION = "unit_configs"
+FIRESTORE_BATCH_LIMIT = 400
+ADMIN_UNITS_PER_PAGE = 10
+
+def config_from_docs(docs):
+    """Unit config dict, in display order, from the per-unit documents."""
+    rows = sorted(((d.id, d.to_dict()) for d in docs if d.exists), key=lambda r: r[1].get("order", 0))
+    return {
+        unit: {"dashboard_url": r.get("dashboard_url", ""), "excel_url": r.get("excel_url", "")}
+        for unit, r in rows
+    }
+
+def refresh_config(store):
+    """Read the unit documents (bounded by CONFIG_TIMEOUT_SEC) and start listening for changes."""
+    store["checked_at"] = datetime.now()  # Even on failure, wait a TTL before retrying
+    db = get_db()
+    if not db:
+        return
+    units_ref = db.collection(UNITS_COLLECTION)
+    try:
+        docs = list(units_ref.get(timeout=CONFIG_TIMEOUT_SEC))
+        if not docs:
+            legacy = db.collection("settings").document("unit_config").get(timeout=CONFIG_TIMEOUT_SEC)
     except Exception:
-        return DEFAULT_URLS
-    return DEFAULT_URLS
+        return  # Slow or unreachable: keep serving the cached/local copy
+    if docs:
+        apply_config(store, config_from_docs(docs))
+    else:
+        save_config(legacy.to_dict() if legacy.exists else DEFAULT_URLS)
 
-def save_config(data):
-    """Save URLs to Firebase Firestore."""
+    if store["listener"] is None:
+        def on_snapshot(docs, changes, read_time):
+            apply_config(store, config_from_docs(docs))
+        try:
+            store["listener"] = units_ref.on_snapshot(on_snapshot)
+        except Exception:
+            pass  # Fall back to TTL-based re-reads
+
+def load_config():
+    """Load URLs from the in-process config cache, refreshing from Firestore when needed."""
+    store = get_config_store()
+    checked_at = store["checked_at"]
+    stale = checked_at is None or (datetime.now() - checked_at).total_seconds() > CONFIG_TTL_SEC
+    if store["listener"] is None and stale:
+        try:
+            refresh_config(store)
+        except Exception:
+            pass
+    return store["data"]
+
+def dashboard_url(details):
+    """The direct download link from a unit's config entry (older configs stored a bare string)."""
+    return details.get("dashboard_url", "") if isinstance(details, dict) else str(details)
+
+def excel_url(details):
+    """The reference Excel link from a unit's config entry ("" for bare-string entries)."""
+    return details.get("excel_url", "") if isinstance(details, dict) else ""
+
+def save_config(data, units=None):
+    """Save URLs to Firebase Firestore, one document per unit.
+
+    `units` limits the write to those units; by default every unit is written and
+    documents for units no longer in `data` are deleted.
+    """
+    # Apply locally first so this process sees the change even before the listener fires
+    apply_config(get_config_store(), data)
     try:
         db = get_db()
         if db:
-            doc_ref = db.collection("settings").document("unit_config")
-            doc_ref.set(data)
+            units_ref = db.collection(UNITS_COLLECTION)
+            order = {unit: i for i, unit in enumerate(data)}
+            writes = [
+                ("set", unit, {"dashboard_url": dashboard_url(data[unit]),
+                               "excel_url": excel_url(data[unit]),
+                               "order": order[unit]})
+                for unit in (units if units is not None else data)
+            ]
+            if units is None:
+                writes += [("delete", doc.id, None) for doc in units_ref.list_documents() if doc.id not in data]
+            for start in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+                batch = db.batch()
+                for op, unit, payload in writes[start:start + FIRESTORE_BATCH_LIMIT]:
+                    if op == "set":
+                        batch.set(units_ref.document(unit), payload)
+                    else:
+                        batch.delete(units_ref.document(unit))
+                batch.commit()
     except Exception:
         pass
 
@@ -110,6 +245,8 @@ if 'show_login' not in st.session_state:
 
 if 'show_summary' not in st.session_state:
     st.session_state.show_summary = False
+if 'show_trends' not in st.session_state:
+    st.session_state.show_trends = False
 
 # ================= CUSTOM CSS =================
 st.markdown("""
@@ -149,6 +286,10 @@ div[data-baseweb="select"] > div, div[data-baseweb="input"] > div {
 .ribbon-header { color:white; }
 .ribbon-title { font-size: 32px; font-weight: 800; }
 .ribbon-time { font-size: 14px; opacity: 0.9; margin-top: 5px; font-weight: 500; }
+.stale-badge {
+    background: #fef3c7; color: #92400e; border-radius: 10px;
+    padding: 2px 10px; margin-left: 10px; font-weight: 700; font-size: 12px;
+}
 
 /* ================= NEW GROUP CARD STYLING ================= */
 .group-card {
@@ -265,28 +406,1200 @@ div.stButton > button {
 """, unsafe_allow_html=True)
 
 # ================= DATA LOADER =================
-@st.cache_data(ttl=300)
-def load_data(url):
+NUM_COLS = ['ORD QTY','CAN CUT QTY','CUT QTY','FAB Req','FAB RCVD', 'FABRIC USED',
+            'FABRIC LEFTOVER STOCK','STD Cons','CAD Cons',
+            'ACHIEVED CONS','CAN CUT %','CUT %']
+
+# Only these columns are kept; pandas still reads every cell, then usecols trims the frame
+REQUIRED_COLS = NUM_COLS + ['END DATE', 'BUYER', 'STATUS', 'STYLE NO', 'COLOUR', 'REMARKS']
+
+# "auto" uses the Rust-based calamine reader (python-calamine, in requirements.txt), which parses
+# several times faster than openpyxl; openpyxl is only the fallback when it is missing
+XLSX_ENGINE = os.environ.get("FCR_XLSX_ENGINE", "auto")
+
+# Dimension columns are stored as categoricals so filters compare small integer codes
+DIM_COLS = ['BUYER', 'STATUS', 'STYLE NO', 'COLOUR', 'MONTH_STR', 'WEEK_FMT']
+
+# Bump whenever parse_workbook's output changes so old snapshots are not reused
+PARSE_VERSION = 4
+
+def pick_xlsx_engine():
+    if XLSX_ENGINE != "auto":
+        return XLSX_ENGINE
+    if importlib.util.find_spec("python_calamine") is not None:
+        return "calamine"
+    return "openpyxl"
+
+def week_labels(dates):
+    """ISO week of each date as "WK01".."WK53", or "N/A" when the date is missing."""
+    week = dates.dt.isocalendar().week
+    return ("WK" + week.astype("Int64").astype(str).str.zfill(2)).where(week.notna(), "N/A")
+
+def parse_workbook(content, engine="openpyxl"):
+    """Turn raw workbook bytes into the dashboard DataFrame.
+
+    The result is shared by every session and treated as read-only; derived date columns
+    (MONTH_STR, WEEK_FMT, YEAR) are added here once instead of by the views.
+    """
+    # usecols only shapes the result: the engine reads the whole sheet either way, so the
+    # speed comes from the engine choice, not from the projection
+    df = pd.read_excel(BytesIO(content), engine=engine, usecols=lambda c: c in REQUIRED_COLS)
+
+    for c in NUM_COLS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
+
+    if 'END DATE' in df.columns:
+        df['END DATE'] = pd.to_datetime(df['END DATE'], errors='coerce', dayfirst=True)
+        df['MONTH_STR'] = df['END DATE'].dt.strftime('%b-%y').str.upper().fillna("N/A")
+        df['WEEK_FMT'] = week_labels(df['END DATE'])
+        df['YEAR'] = df['END DATE'].dt.isocalendar().year.astype("Int64")
+    else:
+        df['MONTH_STR'] = "N/A"
+        df['WEEK_FMT'] = "N/A"
+        df['YEAR'] = pd.Series(pd.NA, index=df.index, dtype="Int64")
+
+    # Mixed int/str cells (e.g. numeric style numbers) become strings; blanks stay missing
+    for c in DIM_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype(str).where(df[c].notna()).astype('category')
+    return df
+
+# ================= FILTER INDEX =================
+# Inverted index over the header filter dimensions: every value maps to the sorted row ids
+# holding it (its posting list), so a selection becomes a row bitmap without slicing the frame.
+FILTER_DIMS = ['MONTH_STR', 'BUYER', 'STATUS', 'STYLE NO']
+
+def build_filter_index(df):
+    index = {"n_rows": len(df)}
+    for dim in FILTER_DIMS:
+        values = [str(v) for v in df[dim].cat.categories]
+        codes = df[dim].cat.codes.to_numpy()
+        order = np.argsort(codes, kind="stable")
+        # Postings of value i are order[bounds[i]:bounds[i + 1]]; missing values (-1) sort first
+        bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        index[dim] = {
+            "values": values,
+            "lookup": {v: i for i, v in enumerate(values)},
+            "codes": codes,
+            "order": order,
+            "bounds": bounds,
+        }
+        if dim in SEARCH_DIMS:
+            index[dim]["search"] = build_search_index(values)
+    return index
+
+def index_mask(index, dim, selected, mask=None):
+    """Row bitmap for `dim in selected`, intersected with `mask` when one is given."""
+    entry = index[dim]
+    hits = np.zeros(index["n_rows"], dtype=bool)
+    for value in selected:
+        i = entry["lookup"].get(value)
+        if i is not None:
+            hits[entry["order"][entry["bounds"][i]:entry["bounds"][i + 1]]] = True
+    return hits if mask is None else hits & mask
+
+def index_options(index, dim, mask=None):
+    """Sorted values of `dim` that occur in the rows selected by `mask` (all rows when None)."""
+    entry = index[dim]
+    codes = entry["codes"] if mask is None else entry["codes"][mask]
+    counts = np.bincount(codes[codes >= 0], minlength=len(entry["values"]))
+    return sorted(v for v in np.asarray(entry["values"], dtype=object)[counts > 0] if v != 'nan')
+
+# ================= TYPE-AHEAD SEARCH =================
+# Per-value search structures for dimensions too large for a plain multiselect: the values
+# sorted case-insensitively for prefix lookups by bisection, and trigram posting lists for
+# substring lookups. Both work on category codes, so results combine with row bitmaps.
+SEARCH_DIMS = ['STYLE NO']
+SEARCH_LIMIT = int(os.environ.get("FCR_SEARCH_LIMIT", "50"))
+
+def build_search_index(values):
+    keys = [v.upper() for v in values]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    trigrams = {}
+    for code, key in enumerate(keys):
+        for gram in {key[i:i + 3] for i in range(len(key) - 2)}:
+            trigrams.setdefault(gram, []).append(code)
+    return {
+        "keys": keys,
+        "order": order,
+        "sorted": [keys[c] for c in order],
+        "trigrams": {g: np.array(codes) for g, codes in trigrams.items()},
+    }
+
+def index_available(index, dim, mask=None):
+    """Bool array over the value codes of `dim`: does the value occur in the rows of `mask`."""
+    entry = index[dim]
+    codes = entry["codes"] if mask is None else entry["codes"][mask]
+    return np.bincount(codes[codes >= 0], minlength=len(entry["values"])) > 0
+
+def index_search(index, dim, query, available=None, limit=SEARCH_LIMIT):
+    """Up to `limit` values of `dim` matching `query`: prefix matches first, then substrings."""
+    entry = index[dim]
+    search = entry["search"]
+    q = query.strip().upper()
+    lo = bisect.bisect_left(search["sorted"], q)
+    hi = bisect.bisect_left(search["sorted"], q + "\uffff") if q else len(search["sorted"])
+    codes = search["order"][lo:hi]
+    if len(q) >= 3:
+        # Candidates share every trigram of the query; the substring check removes false hits
+        postings = sorted((search["trigrams"].get(q[i:i + 3], np.empty(0, dtype=int)) for i in range(len(q) - 2)), key=len)
+        candidates = postings[0]
+        for posting in postings[1:]:
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        prefixed = set(codes)
+        codes = codes + sorted(
+            (c for c in candidates.tolist() if c not in prefixed and q in search["keys"][c]),
+            key=search["keys"].__getitem__,
+        )
+    matches = []
+    for c in codes:
+        if (available is None or available[c]) and entry["values"][c] != 'nan':
+            matches.append(entry["values"][c])
+            if len(matches) == limit:
+                break
+    return matches
+
+# ================= KPI CUBE =================
+# Additive measures pre-aggregated once per load over month, week, buyer and status, so the
+# cards are summed from a few hundred cube rows instead of rescanning every order line.
+# STYLE NO is left out (it has about as many values as there are lines); a style selection
+# is cubed from just its own rows instead, see selected_cube().
+CUBE_DIMS = ['MONTH_STR', 'WEEK_FMT', 'BUYER', 'STATUS']
+CUBE_SUM_COLS = ['ORD QTY', 'CAN CUT QTY', 'CUT QTY', 'FAB Req', 'FAB RCVD', 'FABRIC USED',
+                 'FABRIC LEFTOVER STOCK', 'CAN CUT %', 'CUT %']
+
+def build_kpi_cube(df, sign=None):
+    """Sum the measures per dimension combination; sign (+1/-1 per row) builds a delta cube."""
+    cube = pd.DataFrame(index=df.index)
+    for dim in CUBE_DIMS:
+        if dim in df.columns:
+            cube[dim] = df[dim]
+        else:
+            cube[dim] = "N/A"
+    for c in CUBE_SUM_COLS:
+        cube[c] = df[c] if c in df.columns else 0
+    # Numerator of the ORD QTY-weighted CAD Cons
+    cube['CAD_W'] = (df['CAD Cons'] * df['ORD QTY']) if {'CAD Cons', 'ORD QTY'} <= set(df.columns) else 0
+    cube['ROWS'] = 1
+    if sign is not None:
+        measures = [c for c in cube.columns if c not in CUBE_DIMS]
+        cube[measures] = cube[measures].mul(sign, axis=0)
+    return cube.groupby(CUBE_DIMS, dropna=False, observed=True, sort=False).sum().reset_index()
+
+def filter_cube(cube, months=None, buyers=None, statuses=None, weeks=None):
+    mask = pd.Series(True, index=cube.index)
+    for dim, selected in (('MONTH_STR', months), ('WEEK_FMT', weeks), ('BUYER', buyers),
+                          ('STATUS', statuses)):
+        if selected:
+            mask &= cube[dim].isin(selected)
+    return cube[mask]
+
+# Per-unit (month, week, status) table behind the All Units Summary, rolled up from the cube
+SUMMARY_DIMS = ['MONTH_STR', 'WEEK_FMT', 'STATUS']
+SUMMARY_SUM_COLS = ['ORD QTY', 'FAB Req', 'CAD_W', 'CAN CUT %', 'CUT %', 'FABRIC LEFTOVER STOCK', 'ROWS']
+
+def build_summary_table(cube):
+    return cube.groupby(SUMMARY_DIMS, dropna=False, observed=True, sort=False)[SUMMARY_SUM_COLS].sum().reset_index()
+
+def summary_row(unit_name, totals):
+    """One All Units Summary row from summed summary-table measures."""
+    s_ord = totals['ORD QTY']
+    return {
+        "UNIT NAME": unit_name,
+        "ORD QTY": s_ord,
+        "STD Cons": (totals['FAB Req'] / s_ord) if s_ord > 0 else 0,
+        "CAD Cons": (totals['CAD_W'] / s_ord) if s_ord > 0 else 0,
+        "CAN CUT %": totals['CAN CUT %'] / totals['ROWS'],
+        "CUT %": totals['CUT %'] / totals['ROWS'],
+        "LEFTOVER STOCK": totals['FABRIC LEFTOVER STOCK'],
+    }
+
+# ================= KPI ENGINE =================
+def compute_kpis(cube_totals, df, row_mask=None):
+    """Every card metric, alert flag and exception mask for one filter selection.
+
+    Totals come from the KPI cube; the exception masks come from one vectorised pass over
+    CUT % / CAN CUT % and span the whole frame, so the detail view can index with them.
+    """
+    t = cube_totals
+    rows = t['ROWS']
+    k = {
+        'sum_ord': t['ORD QTY'], 'sum_cancut': t['CAN CUT QTY'], 'sum_cut': t['CUT QTY'],
+        'sum_req': t['FAB Req'], 'sum_rcvd': t['FAB RCVD'], 'sum_used': t['FABRIC USED'],
+        'sum_stock': t['FABRIC LEFTOVER STOCK'],
+    }
+    # STD Cons = FAB Req / ORD QTY, CAD Cons = sum(CAD Cons * ORD QTY) / ORD QTY,
+    # Achieved Cons = FABRIC USED / CUT QTY
+    k['avg_std'] = (k['sum_req'] / k['sum_ord']) if k['sum_ord'] > 0 else 0
+    k['avg_cad'] = (t['CAD_W'] / k['sum_ord']) if k['sum_ord'] > 0 else 0
+    k['avg_ach'] = (k['sum_used'] / k['sum_cut']) if k['sum_cut'] > 0 else 0
+    k['avg_cancut_p'] = t['CAN CUT %'] / rows * 100 if rows else 0
+    k['avg_cut_p'] = t['CUT %'] / rows * 100 if rows else 0
+    k['perf_cut'] = (k['sum_cut'] / k['sum_cancut'] * 100) if k['sum_cancut'] > 0 else 0
+    k['perf_rcvd'] = (k['sum_rcvd'] / k['sum_req'] * 100) if k['sum_req'] > 0 else 0
+    k['perf_cons'] = k['avg_ach'] - k['avg_std']
+
+    # Metrics shown in red; a card flashes when any of its metrics is red
+    k['red'] = {
+        'perf_cut': k['perf_cut'] < 100,
+        'cancut': k['avg_cancut_p'] < 100,
+        'cut': k['avg_cut_p'] < k['avg_cancut_p'],
+        'rcvd': k['sum_rcvd'] < k['sum_req'],
+        'stock': k['sum_stock'] < 0,
+        'cad': k['avg_cad'] > k['avg_std'],
+        'ach': k['avg_ach'] > k['avg_std'],
+        'cons': k['perf_cons'] > 0,
+    }
+    red = k['red']
+    k['alerts'] = {
+        'qty': red['perf_cut'] or red['cancut'] or red['cut'],
+        'fab': red['rcvd'] or red['stock'],
+        'cons': red['cad'] or red['ach'] or red['cons'],
+    }
+
+    # Exception masks: one pass over the two percentage columns
+    cut = df['CUT %'].to_numpy()
+    cancut = df['CAN CUT %'].to_numpy()
+    selected = row_mask if row_mask is not None else np.ones(len(df), dtype=bool)
+    cut_below_101 = cut < 1.01
+    k['ex_masks'] = {
+        'ex1': selected & (cut < 1),
+        'ex2': selected & (cancut < 1.01) & cut_below_101,
+        'ex3': selected & (cut < cancut) & cut_below_101,
+    }
+    k['ex_counts'] = {name: int(np.count_nonzero(m)) for name, m in k['ex_masks'].items()}
+    return k
+
+def build_derived(df, fingerprints=None):
+    """Everything computed once per dataset version, stored next to the DataFrame."""
+    cube = build_kpi_cube(df)
+    derived = {"cube": cube, "summary": build_summary_table(cube), "filter_index": build_filter_index(df)}
+    if INGEST_MODE == "delta":
+        derived["row_keys"], derived["row_hashes"] = fingerprints or row_fingerprints(df)
+    return derived
+
+# ================= DELTA INGEST =================
+# Each order line gets a key (buyer + style + colour + end date, plus its occurrence number
+# among identical keys) and a hash of its contents. A refresh diffs those against the resident
+# dataset and applies only the inserted/updated/deleted lines to the cube and summary table.
+# Opt-in (FCR_INGEST_MODE=delta): it reports what changed per refresh, but hashing every row
+# and merging the deltas measured slower than a plain rebuild, so "full" is the default.
+INGEST_MODE = os.environ.get("FCR_INGEST_MODE", "full")
+ROW_KEY_COLS = ['BUYER', 'STYLE NO', 'COLOUR', 'END DATE']
+# Past this share of changed lines a full rebuild is cheaper than applying deltas
+DELTA_MAX_FRACTION = float(os.environ.get("FCR_DELTA_MAX_FRACTION", "0.5"))
+
+def row_fingerprints(df):
+    """(row keys, content hashes) for every line, as uint64 arrays."""
+    key_cols = [c for c in ROW_KEY_COLS if c in df.columns]
+    if key_cols:
+        occurrence = df.groupby(key_cols, dropna=False, observed=True, sort=False).cumcount()
+    else:
+        occurrence = pd.Series(np.arange(len(df)), index=df.index)
+    keys = pd.util.hash_pandas_object(df[key_cols].assign(_occ=occurrence), index=False).to_numpy()
+    content_cols = [c for c in REQUIRED_COLS if c in df.columns]
+    hashes = pd.util.hash_pandas_object(df[content_cols], index=False).to_numpy()
+    return keys, hashes
+
+def diff_rows(old_keys, old_hashes, new_keys, new_hashes):
+    """Positions of removed lines in the old frame and added lines in the new one, plus counts."""
+    in_old = pd.Index(old_keys).get_indexer(new_keys)
+    in_new = pd.Index(new_keys).get_indexer(old_keys)
+    inserted = in_old == -1
+    deleted = in_new == -1
+    updated_new = ~inserted & (old_hashes[np.where(inserted, 0, in_old)] != new_hashes)
+    removed = deleted.copy()
+    removed[in_old[updated_new]] = True
+    stats = {
+        "inserted": int(inserted.sum()),
+        "updated": int(updated_new.sum()),
+        "deleted": int(deleted.sum()),
+    }
+    stats["unchanged"] = len(new_keys) - stats["inserted"] - stats["updated"]
+    return np.flatnonzero(removed), np.flatnonzero(inserted | updated_new), stats
+
+def apply_delta(table, delta, dims):
+    """Add a signed delta table to an additive table, dropping groups left with no rows."""
+    merged = pd.concat([table, delta], ignore_index=True)
+    merged = merged.groupby(dims, dropna=False, observed=True, sort=False).sum().reset_index()
+    merged = merged[merged['ROWS'] != 0].reset_index(drop=True)
+    for dim in dims:
+        merged[dim] = merged[dim].astype('category')
+    return merged
+
+def ingest_delta(entry, df):
+    """Derived state for df built from the resident entry plus the changed lines.
+
+    Falls back to a full build_derived (with delta None) when the entry has no fingerprints
+    or too many lines changed.
+    """
+    if "row_keys" not in entry:
+        return {**build_derived(df), "delta": None}
+    keys, hashes = row_fingerprints(df)
+    removed, added, stats = diff_rows(entry["row_keys"], entry["row_hashes"], keys, hashes)
+    if len(removed) + len(added) > DELTA_MAX_FRACTION * max(len(df), 1):
+        return {**build_derived(df, (keys, hashes)), "delta": None}
+    changed = pd.concat([entry["df"].iloc[removed], df.iloc[added]], ignore_index=True)
+    sign = np.r_[np.full(len(removed), -1), np.ones(len(added), dtype=int)]
+    delta = build_kpi_cube(changed, sign)
+    return {
+        "cube": apply_delta(entry["cube"], delta, CUBE_DIMS),
+        "summary": apply_delta(entry["summary"], build_summary_table(delta), SUMMARY_DIMS),
+        # Category codes change with the frame, so the posting lists are always rebuilt
+        "filter_index": build_filter_index(df),
+        "row_keys": keys,
+        "row_hashes": hashes,
+        "delta": stats,
+    }
+
+# ================= SNAPSHOT CACHE =================
+# Parsed workbooks are kept on disk as Parquet, keyed by the SHA-256 of the raw bytes,
+# so a restart or a second server process can skip read_excel entirely.
+SNAPSHOT_DIR = os.environ.get("FCR_SNAPSHOT_DIR", os.path.join(".fcr_cache", "snapshots"))
+SNAPSHOT_MAX_MB = int(os.environ.get("FCR_SNAPSHOT_MAX_MB", "512"))
+
+def snapshot_path(digest):
+    return os.path.join(SNAPSHOT_DIR, f"{digest}-v{PARSE_VERSION}.parquet")
+
+def read_snapshot(digest):
+    path = snapshot_path(digest)
+    if not os.path.exists(path):
+        return None
     try:
-        r = requests.get(url)
-        r.raise_for_status()
-        df = pd.read_excel(BytesIO(r.content), engine="openpyxl")
-        
-        num_cols = ['ORD QTY','CAN CUT QTY','CUT QTY','FAB Req','FAB RCVD', 'FABRIC USED',
-                    'FABRIC LEFTOVER STOCK','STD Cons','CAD Cons',
-                    'ACHIEVED CONS','CAN CUT %','CUT %']
-        for c in num_cols:
-            if c in df.columns:
-                df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
+        df = pd.read_parquet(path)
+        os.utime(path)  # Touch so eviction treats it as recently used
+        return df
+    except Exception:
+        return None
+
+def write_snapshot(digest, df):
+    path = snapshot_path(digest)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        evict_snapshots()
+    except Exception:
+        # Not every sheet survives Arrow (e.g. mixed int/str columns); just skip the snapshot
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def list_snapshots():
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    files = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name.endswith(".parquet"):
+            stat = os.stat(os.path.join(SNAPSHOT_DIR, name))
+            files.append((stat.st_mtime, stat.st_size, os.path.join(SNAPSHOT_DIR, name)))
+    return sorted(files)
+
+def evict_snapshots(max_bytes=None):
+    """Delete least recently used snapshots until the folder fits in SNAPSHOT_MAX_MB."""
+    if max_bytes is None:
+        max_bytes = SNAPSHOT_MAX_MB * 1024 * 1024
+    files = list_snapshots()
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def purge_snapshots():
+    """Remove every snapshot. Returns how many files were deleted."""
+    removed = 0
+    for _, _, path in list_snapshots():
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+# ================= HISTORY STORE =================
+# Every newly parsed workbook version is appended to a Parquet dataset partitioned as
+# unit=<unit>/month=<END DATE month>/part-*.parquet, so trends outlive the rows SharePoint
+# keeps. Only partitions whose rows changed get a new part file; compaction keeps the last
+# snapshot of each day for HISTORY_RETENTION_DAYS, and whole months go after
+# HISTORY_KEEP_MONTHS. Writes run on the cache's single history worker, off the fetch path.
+HISTORY_DIR = os.environ.get("FCR_HISTORY_DIR", os.path.join(".fcr_cache", "history"))
+HISTORY_RETENTION_DAYS = int(os.environ.get("FCR_HISTORY_RETENTION_DAYS", "90"))
+HISTORY_KEEP_MONTHS = int(os.environ.get("FCR_HISTORY_KEEP_MONTHS", "36"))
+HISTORY_COMPACT_FILES = int(os.environ.get("FCR_HISTORY_COMPACT_FILES", "8"))
+HISTORY_DIMS = ['BUYER', 'STATUS', 'STYLE NO', 'COLOUR']
+
+def history_unit_key(unit_name):
+    return "".join(ch if ch.isalnum() else "_" for ch in str(unit_name)).upper()
+
+def utc_timestamp(epoch_seconds):
+    return pd.Timestamp(epoch_seconds, unit='s')
+
+def history_frame(df, snapshot_at):
+    """The rows to archive, with a fixed schema so every part file can be read as one dataset."""
+    out = pd.DataFrame({c: pd.to_numeric(df[c], errors='coerce').astype('float64') if c in df.columns else np.nan
+                        for c in NUM_COLS})
+    for c in HISTORY_DIMS:
+        out[c] = df[c].astype(object).where(df[c].notna(), None) if c in df.columns else None
+    out['END DATE'] = df['END DATE'] if 'END DATE' in df.columns else pd.NaT
+    # Naive UTC, like every other SNAPSHOT_AT comparison in this section
+    out['SNAPSHOT_AT'] = utc_timestamp(snapshot_at).floor('s')
+    return out
+
+def partition_digest(part):
+    """Hash of a partition's archived rows, ignoring when they were snapshotted."""
+    hashed = pd.util.hash_pandas_object(part.drop(columns='SNAPSHOT_AT'), index=False)
+    return hashlib.sha256(hashed.to_numpy().tobytes()).hexdigest()
+
+def append_history(unit_name, df, snapshot_at):
+    """Write one workbook version into the month partitions whose rows changed."""
+    if not unit_name or df.empty:
+        return
+    try:
+        hist = history_frame(df, snapshot_at)
+        months = hist['END DATE'].dt.strftime('%Y-%m').fillna("none")
+        unit_dir = os.path.join(HISTORY_DIR, f"unit={history_unit_key(unit_name)}")
+        for month, part in hist.groupby(months, sort=False):
+            part_dir = os.path.join(unit_dir, f"month={month}")
+            # The digest file is dot-prefixed, so the Parquet dataset reader skips it
+            digest_path = os.path.join(part_dir, ".digest")
+            digest = partition_digest(part)
+            try:
+                with open(digest_path) as f:
+                    if f.read() == digest:
+                        continue
+            except OSError:
+                pass
+            os.makedirs(part_dir, exist_ok=True)
+            path = os.path.join(part_dir, f"part-{int(snapshot_at * 1000)}-{os.getpid()}.parquet")
+            part.to_parquet(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+            with open(f"{digest_path}.tmp", "w") as f:
+                f.write(digest)
+            os.replace(f"{digest_path}.tmp", digest_path)
+            compact_partition(part_dir)
+        expire_history(unit_dir)
+    except Exception:
+        pass  # History is best effort; the live dashboard never depends on it
+
+def compact_partition(part_dir):
+    """Merge a partition's part files into one, keeping each day's last snapshot within retention."""
+    parts = sorted(n for n in os.listdir(part_dir) if n.endswith(".parquet"))
+    if len(parts) < HISTORY_COMPACT_FILES:
+        return
+    paths = [os.path.join(part_dir, n) for n in parts]
+    hist = pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+    latest = hist['SNAPSHOT_AT'].max()
+    cutoff = utc_timestamp(time.time()) - pd.Timedelta(days=HISTORY_RETENTION_DAYS)
+    day_last = hist.groupby(hist['SNAPSHOT_AT'].dt.floor('D'))['SNAPSHOT_AT'].transform('max')
+    keep = (hist['SNAPSHOT_AT'] == day_last) & (hist['SNAPSHOT_AT'] >= cutoff)
+    hist = hist[keep | (hist['SNAPSHOT_AT'] == latest)]
+    # The newest part holds the latest snapshot, so it is replaced last and readers never lose it
+    hist.to_parquet(f"{paths[-1]}.tmp", index=False)
+    for path in paths[:-1]:
+        os.remove(path)
+    os.replace(f"{paths[-1]}.tmp", paths[-1])
+
+def expire_history(unit_dir):
+    """Drop whole month partitions older than HISTORY_KEEP_MONTHS."""
+    oldest = (pd.Timestamp.now() - pd.DateOffset(months=HISTORY_KEEP_MONTHS)).strftime('%Y-%m')
+    for name in os.listdir(unit_dir):
+        month = name.removeprefix("month=")
+        if month != "none" and month < oldest:
+            shutil.rmtree(os.path.join(unit_dir, name), ignore_errors=True)
+
+def history_months(unit_names):
+    """Months with archived data for any of the units, read from the partition folders alone."""
+    months = set()
+    for unit_name in unit_names:
+        unit_dir = os.path.join(HISTORY_DIR, f"unit={history_unit_key(unit_name)}")
+        if os.path.isdir(unit_dir):
+            months.update(n.removeprefix("month=") for n in os.listdir(unit_dir) if n != "month=none")
+    return sorted(months)
+
+def read_history(unit_names, months, columns):
+    """Latest archived rows for the given units and months; only matching partitions are opened."""
+    keys = {history_unit_key(u): u for u in unit_names}
+    if not keys or not months or not os.path.isdir(HISTORY_DIR):
+        return pd.DataFrame()
+    try:
+        hist = pd.read_parquet(
+            HISTORY_DIR,
+            columns=list(columns) + ['SNAPSHOT_AT', 'unit', 'month'],
+            filters=[('unit', 'in', list(keys)), ('month', 'in', list(months))],
+        )
+    except Exception:
+        return pd.DataFrame()
+    hist['unit'] = hist['unit'].astype(str).map(keys)
+    hist['month'] = hist['month'].astype(str)
+    latest = hist.groupby(['unit', 'month'], observed=True)['SNAPSHOT_AT'].transform('max')
+    return hist[hist['SNAPSHOT_AT'] == latest]
+
+# ================= SHARED CROSS-PROCESS CACHE =================
+# Several server processes on one machine share the downloaded workbook bytes (plus
+# validators and a version stamp) through SQLite, and the parsed frames through the
+# Parquet snapshots above, so one process's fetch serves all of them.
+SHARED_CACHE_BACKEND = os.environ.get("FCR_SHARED_CACHE", "sqlite")  # "sqlite" or "none"
+SHARED_CACHE_PATH = os.environ.get("FCR_SHARED_CACHE_PATH", os.path.join(".fcr_cache", "shared.db"))
+# A fetch by another process younger than this is reused instead of hitting SharePoint
+SHARED_FRESH_SEC = int(os.environ.get("FCR_SHARED_FRESH", "60"))
+
+class NullSharedCache:
+    """Backend used when sharing is switched off: every process fetches for itself."""
+
+    def get(self, url):
+        return None
+
+    def put(self, url, content, digest, validators, fetched_at):
+        return None
+
+    def touch(self, url, fetched_at):
+        return None
+
+    def lock(self, url):
+        return nullcontext()
+
+class SQLiteSharedCache:
+    """Workbook bytes per URL in a local SQLite file, guarded by per-URL flock files."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_dir = os.path.join(os.path.dirname(path) or ".", "locks")
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS workbooks ("
+                "url TEXT PRIMARY KEY, sha256 TEXT, etag TEXT, last_modified TEXT, "
+                "fetched_at REAL, version INTEGER, content BLOB)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, url):
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT sha256, etag, last_modified, fetched_at, version, content FROM workbooks WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("sha256", "etag", "last_modified", "fetched_at", "version", "content")
+        return dict(zip(keys, row))
+
+    def put(self, url, content, digest, validators, fetched_at):
+        """Store a fresh download; the version only goes up when the bytes changed."""
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT INTO workbooks VALUES (?, ?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT(url) DO UPDATE SET "
+                "version = version + (sha256 != excluded.sha256), sha256 = excluded.sha256, "
+                "etag = excluded.etag, last_modified = excluded.last_modified, "
+                "fetched_at = excluded.fetched_at, content = excluded.content",
+                (url, digest, validators.get("etag"), validators.get("last_modified"), fetched_at, content),
+            )
+            return db.execute("SELECT version FROM workbooks WHERE url = ?", (url,)).fetchone()[0]
+
+    def touch(self, url, fetched_at):
+        """Record a 304 so other processes know the stored bytes are still current."""
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE workbooks SET fetched_at = ? WHERE url = ?", (fetched_at, url))
+            row = db.execute("SELECT version FROM workbooks WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    @contextmanager
+    def lock(self, url):
+        if fcntl is None:  # No flock (e.g. Windows dev machines): in-process single-flight only
+            yield
+            return
+        lock_path = os.path.join(self.lock_dir, hashlib.sha1(url.encode()).hexdigest() + ".lock")
+        with open(lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def make_shared_cache():
+    if SHARED_CACHE_BACKEND == "sqlite":
+        try:
+            return SQLiteSharedCache(SHARED_CACHE_PATH)
+        except (OSError, sqlite3.Error):
+            pass  # Read-only disk etc.: fall back to per-process caching
+    return NullSharedCache()
+
+# ================= HTTP / WORKER POOL =================
+LOAD_WORKERS = int(os.environ.get("FCR_LOAD_WORKERS", "4"))
+
+@st.cache_resource
+def get_http_session():
+    """One keep-alive session shared by every workbook download."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=LOAD_WORKERS, pool_maxsize=LOAD_WORKERS * 2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
-        if 'END DATE' in df.columns:
-            df['END DATE'] = pd.to_datetime(df['END DATE'], errors='coerce', dayfirst=True)
-            df['MONTH_STR'] = df['END DATE'].dt.strftime('%b-%y').str.upper().fillna("N/A")
+@st.cache_resource
+def get_load_pool():
+    """Bounded thread pool for loading several units at once."""
+    return ThreadPoolExecutor(max_workers=LOAD_WORKERS, thread_name_prefix="fcr-load")
+
+@st.cache_resource
+def get_workbook_cache():
+    """Last validators (ETag, Last-Modified, length, hash) and parsed DataFrame per URL."""
+    # "inflight" holds one Future per URL being fetched; "dedup_saved" counts callers that joined one
+    return {
+        "lock": threading.Lock(),
+        "entries": {},
+        "inflight": {},
+        "dedup_saved": 0,
+        "breakers": {},
+        "unit_names": {},
+        "shared": make_shared_cache(),
+        # One worker, so history writes (and compactions) for a process never overlap
+        "history_pool": ThreadPoolExecutor(max_workers=1, thread_name_prefix="fcr-history"),
+    }
+
+def fetch_workbook(url, cache=None, session=None, force=False, interactive=True):
+    """Download a workbook, skipping the parse when the server or the bytes say it is unchanged.
+
+    Only one fetch per URL runs at a time; concurrent callers wait for it and share its result.
+    `force` always asks SharePoint instead of reusing another process's recent download;
+    `interactive` (a user is waiting) means fewer retries and a shorter deadline.
+    """
+    # The background refresher passes its own handles so it never touches st.* from its thread
+    cache = cache or get_workbook_cache()
+    session = session or get_http_session()
+    with cache["lock"]:
+        flight = cache["inflight"].get(url)
+        if flight is None:
+            flight = cache["inflight"][url] = Future()
+            leader = True
         else:
-            df['MONTH_STR'] = "N/A"
+            cache["dedup_saved"] += 1
+            leader = False
+    if not leader:
+        return flight.result()
+
+    try:
+        check_breaker(cache, url)
+        try:
+            df = _fetch_workbook(url, cache, session, force, interactive)
+        except Exception as e:
+            record_fetch_failure(cache, url, e)
+            raise
+        record_fetch_success(cache, url)
+        flight.set_result(df)
         return df
     except Exception as e:
-        return pd.DataFrame()
+        flight.set_exception(e)
+        raise
+    finally:
+        with cache["lock"]:
+            cache["inflight"].pop(url, None)
+
+# ================= FETCH RESILIENCE =================
+# Every download has connect/read timeouts, a wall-clock deadline for the whole transfer and
+# jittered retries; a URL that keeps failing trips a circuit breaker so nobody waits on it until
+# the cool-down ends. Callers keep serving the last good dataset (with a staleness badge).
+# Interactive fetches (first load, Refresh) get fewer retries and a shorter deadline than the
+# background refresher.
+HTTP_TIMEOUT = (
+    float(os.environ.get("FCR_HTTP_CONNECT_TIMEOUT", "5")),
+    float(os.environ.get("FCR_HTTP_READ_TIMEOUT", "30")),
+)
+HTTP_RETRIES = int(os.environ.get("FCR_HTTP_RETRIES", "3"))
+HTTP_DEADLINE_SEC = float(os.environ.get("FCR_HTTP_DEADLINE", "120"))
+HTTP_INTERACTIVE_RETRIES = int(os.environ.get("FCR_HTTP_INTERACTIVE_RETRIES", "1"))
+HTTP_INTERACTIVE_DEADLINE_SEC = float(os.environ.get("FCR_HTTP_INTERACTIVE_DEADLINE", "30"))
+HTTP_CHUNK_BYTES = 256 * 1024
+HTTP_BACKOFF_SEC = float(os.environ.get("FCR_HTTP_BACKOFF", "0.5"))
+BREAKER_FAILURES = int(os.environ.get("FCR_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_SEC = int(os.environ.get("FCR_BREAKER_COOLDOWN", "120"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised instead of fetching while a URL's circuit breaker is open."""
+
+class DeadlineExceeded(requests.Timeout):
+    """A download (including its retries) ran past its wall-clock deadline."""
+
+def read_body(r, deadline_at, message):
+    """Read a streamed response body, giving up once `deadline_at` (monotonic) has passed."""
+    chunks = []
+    try:
+        while True:
+            chunk = r.raw.read1(HTTP_CHUNK_BYTES, decode_content=True)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+            if time.monotonic() > deadline_at:
+                raise DeadlineExceeded(message)
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except ReadTimeoutError as e:
+        raise requests.ReadTimeout(e)
+
+def http_get(session, url, headers, retries=HTTP_RETRIES, deadline=HTTP_DEADLINE_SEC):
+    """GET returning (response, body), all attempts together bounded by `deadline` seconds.
+
+    Connection errors, timeouts, broken chunked bodies and 429/5xx answers are retried with
+    jittered exponential backoff. The body is streamed one socket read at a time so a server
+    trickling bytes still hits the deadline (the read timeout only bounds each read).
+    """
+    deadline_at = time.monotonic() + deadline
+    for attempt in range(retries + 1):
+        try:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"{url} took longer than {deadline:.0f}s")
+            timeout = (min(HTTP_TIMEOUT[0], remaining), min(HTTP_TIMEOUT[1], remaining))
+            with session.get(url, headers=headers, timeout=timeout, stream=True) as r:
+                if r.status_code in RETRY_STATUSES and attempt < retries:
+                    raise requests.HTTPError(f"{r.status_code} from {url}", response=r)
+                return r, read_body(r, deadline_at, f"{url} took longer than {deadline:.0f}s")
+        except DeadlineExceeded:
+            raise
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError,
+                requests.exceptions.ChunkedEncodingError):
+            if attempt == retries:
+                raise
+        pause = random.uniform(0, HTTP_BACKOFF_SEC * 2 ** attempt)
+        if time.monotonic() + pause >= deadline_at:
+            raise DeadlineExceeded(f"{url} took longer than {deadline:.0f}s")
+        time.sleep(pause)
+
+def check_breaker(cache, url):
+    with cache["lock"]:
+        breaker = cache["breakers"].get(url)
+    if breaker and breaker["open_until"] and time.time() < breaker["open_until"]:
+        raise CircuitOpenError(f"{url} failing since {breaker['since']:%d-%b %I:%M %p}: {breaker['last_error']}")
+
+def record_fetch_failure(cache, url, error):
+    with cache["lock"]:
+        breaker = cache["breakers"].setdefault(url, {"failures": 0, "since": datetime.now(), "open_until": None})
+        breaker["failures"] += 1
+        breaker["last_error"] = str(error)[:200]
+        if breaker["failures"] >= BREAKER_FAILURES:
+            # Half-open after the cool-down: the next caller gets one attempt
+            breaker["open_until"] = time.time() + BREAKER_COOLDOWN_SEC
+
+def record_fetch_success(cache, url):
+    with cache["lock"]:
+        cache["breakers"].pop(url, None)
+
+def fetch_health(url):
+    """The breaker state for a URL while its fetches are failing, else None."""
+    cache = get_workbook_cache()
+    with cache["lock"]:
+        breaker = cache["breakers"].get(url)
+        return dict(breaker) if breaker else None
+
+# Only this many units keep their full rows in memory; the rest keep just their small
+# summary table and are restored from their Parquet snapshot when someone opens them.
+MAX_RESIDENT_UNITS = int(os.environ.get("FCR_MAX_RESIDENT_UNITS", "8"))
+ROW_KEYS = ("df", "cube", "filter_index", "row_keys", "row_hashes")
+
+def evict_resident(cache, keep=None):
+    """Drop the rows of the least recently viewed units beyond MAX_RESIDENT_UNITS (never `keep`)."""
+    with cache["lock"]:
+        resident = sorted(
+            (e.get("last_used", 0), url) for url, e in cache["entries"].items() if "df" in e and url != keep
+        )
+        limit = MAX_RESIDENT_UNITS - (keep is not None and "df" in cache["entries"].get(keep, {}))
+        for _, url in resident[:max(0, len(resident) - limit)]:
+            entry = cache["entries"][url]
+            cache["entries"][url] = {k: v for k, v in entry.items() if k not in ROW_KEYS}
+
+def restore_rows(entry):
+    """Bring an evicted entry's rows back from its snapshot, or None if the snapshot is gone."""
+    df = read_snapshot(entry["sha256"])
+    if df is None:
+        return None
+    return {**entry, "df": df, **build_derived(df)}
+
+def _fetch_workbook(url, cache, session, force=False, interactive=True):
+    shared = cache["shared"]
+    # Cross-process lock: one server process per URL talks to SharePoint at a time
+    with shared.lock(url):
+        # An evicted entry stays slim here: its validators and summary table are still valid, so a
+        # 304 only refreshes as_of, and rows come back only on a user read (load_dataset)
+        with cache["lock"]:
+            entry = cache["entries"].get(url)
+
+        # Another process fetched this URL moments ago: reuse its bytes instead of downloading,
+        # but only when that download is newer than ours (our own writes land there too)
+        record = None if force else shared.get(url)
+        if (record and time.time() - record["fetched_at"] < SHARED_FRESH_SEC
+                and record["fetched_at"] > (entry or {}).get("fetched_at", 0)):
+            validators = {"etag": record["etag"], "last_modified": record["last_modified"]}
+            return _store_workbook(url, cache, entry, record["content"], validators,
+                                   record["fetched_at"], record["version"])
+
+        # Conditional request: SharePoint answers 304 when the validators still match
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        if interactive:
+            r, content = http_get(session, url, headers, HTTP_INTERACTIVE_RETRIES, HTTP_INTERACTIVE_DEADLINE_SEC)
+        else:
+            r, content = http_get(session, url, headers)
+        fetched_at = time.time()
+        if r.status_code == 304 and entry:
+            version = shared.touch(url, fetched_at)
+            with cache["lock"]:
+                cache["entries"][url] = {
+                    **entry,
+                    "fetched_at": fetched_at,
+                    "as_of": datetime.fromtimestamp(fetched_at),
+                    "version": version or entry.get("version"),
+                }
+            return entry.get("df")
+        r.raise_for_status()
+
+        validators = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+        digest = hashlib.sha256(content).hexdigest()
+        version = shared.put(url, content, digest, validators, fetched_at)
+        return _store_workbook(url, cache, entry, content, validators, fetched_at, version, digest)
+
+def _store_workbook(url, cache, entry, content, validators, fetched_at, version, digest=None):
+    """Install downloaded bytes as the URL's dataset, parsing only when the bytes changed."""
+    # Some servers ignore the validators, so compare the bytes before re-parsing
+    digest = digest or hashlib.sha256(content).hexdigest()
+    validators = {
+        **validators,
+        "length": len(content),
+        "sha256": digest,
+        "fetched_at": fetched_at,
+        "as_of": datetime.fromtimestamp(fetched_at),
+        "version": version,
+    }
+    if entry and entry["length"] == len(content) and entry["sha256"] == digest:
+        new_entry = {**entry, **validators}
+        archive = False
+    else:
+        started = time.perf_counter()
+        df = read_snapshot(digest)
+        engine = "snapshot"
+        if df is None:
+            engine = pick_xlsx_engine()
+            df = parse_workbook(content, engine)
+        if df.empty and entry:
+            # Usually a truncated or placeholder download; never replace good data with nothing
+            raise ValueError("Workbook parsed to an empty table")
+        parse_stats = {"parse_engine": engine, "parse_seconds": time.perf_counter() - started}
+        # A version read from a snapshot was already archived by whoever parsed it
+        archive = engine != "snapshot"
+        if archive:
+            write_snapshot(digest, df)
+        if INGEST_MODE == "delta" and entry and "df" in entry:
+            derived = ingest_delta(entry, df)
+        else:
+            derived = {**build_derived(df), "delta": None}
+        # Fetches never count as use: only load_dataset reads decide which units stay resident
+        new_entry = {**validators, "df": df, **parse_stats, **derived,
+                     "last_used": entry.get("last_used", 0) if entry else 0}
+
+    # Swap the whole entry in one assignment so readers never see a half-updated dataset
+    with cache["lock"]:
+        cache["entries"][url] = new_entry
+        unit_name = cache["unit_names"].get(url)
+    evict_resident(cache)
+    if archive:
+        cache["history_pool"].submit(append_history, unit_name, new_entry["df"], fetched_at)
+    return new_entry.get("df")
+
+def load_dataset(url, need_rows=True, cache=None, session=None):
+    """The resident dataset for a URL (DataFrame plus everything derived from it), or None.
+
+    With need_rows=False an evicted entry is returned as is (summary table, no rows).
+    """
+    cache = cache or get_workbook_cache()
+    with cache["lock"]:
+        entry = cache["entries"].get(url)
+    if entry is None:
+        try:
+            fetch_workbook(url, cache=cache, session=session)
+        except Exception:
+            return None
+        with cache["lock"]:
+            entry = cache["entries"].get(url)
+    if entry is not None and need_rows and "df" not in entry:
+        restored = restore_rows(entry)
+        if restored is None:
+            # Snapshot gone: forget the validators so the next fetch downloads and parses in full
+            with cache["lock"]:
+                if cache["entries"].get(url) is entry:
+                    cache["entries"][url] = {**entry, "etag": None, "last_modified": None, "sha256": None}
+            try:
+                fetch_workbook(url, cache=cache, session=session)
+            except Exception:
+                return None
+            with cache["lock"]:
+                entry = cache["entries"].get(url)
+            restored = entry if "df" in entry else restore_rows(entry)
+        if restored is not None and restored is not entry:
+            with cache["lock"]:
+                # Keep a newer version a concurrent fetch may have installed meanwhile
+                if cache["entries"].get(url) is entry:
+                    cache["entries"][url] = restored
+        entry = restored
+    if entry is not None and "df" in entry:
+        entry["last_used"] = time.monotonic()
+        evict_resident(cache, keep=url)
+    return entry
+
+# ================= BACKGROUND REFRESHER =================
+# A daemon thread revalidates every configured unit on its own schedule, so user reruns
+# always read the last good dataset instead of blocking on SharePoint. Each cycle fans out
+# over the load pool, at most LOAD_WORKERS units at a time so user loads queued on the same
+# pool are never stuck behind a whole cycle.
+REFRESH_INTERVAL_SEC = int(os.environ.get("FCR_REFRESH_INTERVAL", "300"))
+
+def _refresh_loop(state, cache, session, pool):
+    while True:
+        pending = set()
+        for url in list(state["urls"]):
+            if len(pending) >= LOAD_WORKERS:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # reload_unit keeps serving the previous version when a fetch fails
+            pending.add(pool.submit(reload_unit, url, cache, session, interactive=False))
+        wait(pending)
+        state["last_cycle"] = datetime.now()
+        time.sleep(REFRESH_INTERVAL_SEC)
+
+@st.cache_resource
+def get_refresher():
+    state = {"urls": set(), "last_cycle": None}
+    threading.Thread(
+        target=_refresh_loop,
+        args=(state, get_workbook_cache(), get_http_session(), get_load_pool()),
+        name="fcr-refresher",
+        daemon=True,
+    ).start()
+    return state
+
+def reload_unit(url, cache=None, session=None, force=False, interactive=True):
+    """Revalidate one unit right away; other sessions keep the old copy until the new one lands."""
+    try:
+        fetch_workbook(url, cache=cache, session=session, force=force, interactive=interactive)
+    except Exception:
+        pass  # Keep serving the last good dataset
+
+def prewarm_units(new_urls, stale_urls=()):
+    """Drop datasets for URLs that are no longer configured and load the new ones in the background."""
+    cache = get_workbook_cache()
+    with cache["lock"]:
+        for url in stale_urls:
+            cache["entries"].pop(url, None)
+    for url in new_urls:
+        if url:
+            get_load_pool().submit(reload_unit, url, cache, get_http_session(), interactive=False)
+
+def schedule_refresh(unit_urls):
+    """Set the units ({unit: url}) the background refresher keeps warm."""
+    cache = get_workbook_cache()
+    with cache["lock"]:
+        # Fetches only see URLs; the history store partitions by unit name
+        cache["unit_names"] = {url: unit for unit, url in unit_urls.items() if url}
+    state = get_refresher()
+    state["urls"] = set(cache["unit_names"])
+
+def load_units(unit_urls):
+    """Load several units concurrently, yielding (unit, dataset or None) as each one finishes."""
+    # Workers get the shared handles up front so they never call into Streamlit themselves.
+    # The summary only needs each unit's small summary table, so evicted units stay evicted.
+    cache, session = get_workbook_cache(), get_http_session()
+    futures = {
+        get_load_pool().submit(load_dataset, url, False, cache, session): unit
+        for unit, url in unit_urls.items()
+    }
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+# ================= VIEW CACHE =================
+# Card metrics and the buyer chart for one (unit, data version, filter selection), shared by
+# every session. Popular combinations (current month + Completed) are computed once.
+VIEW_CACHE_MAX_MB = int(os.environ.get("FCR_VIEW_CACHE_MB", "64"))
+
+@st.cache_resource
+def get_view_cache():
+    return {"lock": threading.Lock(), "entries": OrderedDict(), "bytes": 0, "hits": 0, "misses": 0}
+
+CHART_TOP_N = int(os.environ.get("FCR_CHART_TOP_N", "15"))
+
+def buyer_performance(cube_rows, top_n=CHART_TOP_N):
+    """Mean Can Cut % / Cut % per buyer from cube rows; buyers past the top N by order qty share one bar."""
+    dfc = cube_rows.groupby('BUYER', observed=True)[['CAN CUT %', 'CUT %', 'ORD QTY', 'ROWS']].sum()
+    dfc.index = dfc.index.astype(str)
+    others = None
+    if len(dfc) > top_n + 1:
+        top = dfc['ORD QTY'].nlargest(top_n).index
+        rest = dfc.drop(top)
+        # The count keeps the bucket's label apart from a real buyer called "Others"
+        others = rest.sum().rename(f"Others ({len(rest)} buyers)").to_frame().T
+        dfc = dfc.loc[top]
+    # Row-weighted means, matching the cards; the bucket is averaged over all of its rows
+    dfc = pd.concat([dfc, others]) if others is not None else dfc.copy()
+    dfc['CAN CUT %'] = dfc['CAN CUT %'] / dfc['ROWS'] * 100
+    dfc['CUT %'] = dfc['CUT %'] / dfc['ROWS'] * 100
+    dfc = dfc.rename_axis('BUYER').reset_index()
+    # Ranked buyers first, the bucket last; it is told apart by position, never by name
+    n_ranked = len(dfc) - (others is not None)
+    ranked = dfc.iloc[:n_ranked].sort_values(by='CAN CUT %', ascending=False)
+    return pd.concat([ranked, dfc.iloc[n_ranked:]], ignore_index=True)
+
+def buyer_figure(dfc):
+    """The Performance by Buyer chart for a buyer_performance() table."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    
+    # 2. Optimized Bar Traces (labels formatted by Plotly, not per value in Python)
+    fig.add_trace(go.Bar(
+        x=dfc['BUYER'], y=dfc['CAN CUT %'], name="Can Cut %", 
+        marker=dict(color="#2c6e9e"),
+        texttemplate="%{y:.1f}%", textposition="auto",
+        marker_cornerradius=10
+    ))
+    
+    fig.add_trace(go.Bar(
+        x=dfc['BUYER'], y=dfc['CUT %'], name="Cut %", 
+        marker=dict(color="#5fa6e1"),
+        texttemplate="%{y:.1f}%", textposition="auto",
+        marker_cornerradius=10
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=dfc['BUYER'], y=dfc['CUT %'], mode='lines+markers', name='Trend',
+        line=dict(color="#e11d48", width=3),
+        marker=dict(size=8, color="#e11d48"),
+        showlegend=False
+    ))
+
+    fig.update_layout(
+        title=dict(
+            text="📈 Performance by Buyer", 
+            font=dict(size=22, color="#1e293b", weight=700),
+            x=0.01 # Aligns title to the left
+        ),
+        hovermode="x unified", 
+        barmode='group', 
+        height=400,
+        # --- INCREASED MARGINS ---
+        # Increasing 'r' (right) from 10 to 40 prevents clipping
+        margin=dict(l=20, r=40, t=60, b=20), 
+        showlegend=True,
+        # --- ADJUSTED LEGEND ---
+        # Setting x to 0.98 instead of 1.0 pulls it away from the edge
+        legend=dict(
+            orientation="h", 
+            yanchor="bottom", 
+            y=1.02, 
+            xanchor="right", 
+            x=0.98 
+        ),
+        yaxis=dict(showgrid=True, gridcolor='#f1f5f9'),
+        xaxis=dict(showgrid=False)
+    )
+    return fig
+
+def selected_cube(dataset, filters, row_mask):
+    """Cube rows for a (months, buyers, statuses, styles) selection."""
+    months, buyers, statuses, styles = filters
+    if styles:
+        # The shared cube has no STYLE NO; the row mask already holds every selected filter
+        return build_kpi_cube(dataset["df"][row_mask])
+    return filter_cube(dataset["cube"], months, buyers, statuses)
+
+def compute_view(dataset, filters, row_mask):
+    df = dataset["df"]
+    # Card totals and the buyer chart come from the cube, exceptions from one vectorised pass
+    cube_rows = selected_cube(dataset, filters, row_mask)
+    kpis = compute_kpis(cube_rows.sum(numeric_only=True), df, row_mask)
+    figure = None
+    if 'BUYER' in df.columns and len(cube_rows):
+        # Stored as plain JSON so every session renders from the same immutable value
+        figure = json.loads(buyer_figure(buyer_performance(cube_rows)).to_json())
+    return {"kpis": kpis, "figure": figure}
+
+def view_size(view):
+    masks = sum(m.nbytes for m in view["kpis"]["ex_masks"].values())
+    return masks + len(json.dumps(view["figure"])) + 2048
+
+def cached_view(url, dataset, filters, row_mask):
+    """compute_view through a size-bounded LRU keyed by unit, data version and normalised filters."""
+    key = (url, dataset["sha256"], tuple(tuple(sorted(map(str, f or ()))) for f in filters))
+    cache = get_view_cache()
+    with cache["lock"]:
+        view = cache["entries"].get(key)
+        if view is not None:
+            cache["entries"].move_to_end(key)
+            cache["hits"] += 1
+            return view
+        cache["misses"] += 1
+    view = compute_view(dataset, filters, row_mask)
+    view["size"] = view_size(view)
+    with cache["lock"]:
+        if key not in cache["entries"]:
+            cache["entries"][key] = view
+            cache["bytes"] += view["size"]
+        while cache["bytes"] > VIEW_CACHE_MAX_MB * 1024 * 1024 and len(cache["entries"]) > 1:
+            _, old = cache["entries"].popitem(last=False)
+            cache["bytes"] -= old["size"]
+    return view
+
+# ================= EXCEPTION DETAIL TABLE =================
+# The detail view pages through exception rows by position: search and sort produce an
+# index array, and only the visible page is sliced out, numbered and styled.
+DETAIL_PAGE_SIZE = int(os.environ.get("FCR_DETAIL_PAGE_SIZE", "100"))
+DETAIL_COLS = ['BUYER', 'STYLE NO', 'COLOUR', 'ORD QTY', 'CAN CUT %', 'CUT %', 'FABRIC LEFTOVER STOCK', 'REMARKS']
+DETAIL_SEARCH_COLS = ['BUYER', 'STYLE NO', 'REMARKS']
+DETAIL_SORT_COLS = ['BUYER', 'STYLE NO', 'ORD QTY', 'CAN CUT %', 'CUT %', 'FABRIC LEFTOVER STOCK']
+
+def column_contains(col, positions, text):
+    """Case-insensitive substring match of col at positions; categoricals test each category once."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        hits = np.append(col.cat.categories.astype(str).str.contains(text, case=False, regex=False), False)
+        return hits[col.cat.codes.to_numpy()[positions]]  # Code -1 (missing) lands on the trailing False
+    values = col.iloc[positions]
+    return values.astype(str).str.contains(text, case=False, regex=False).to_numpy() & values.notna().to_numpy()
+
+def detail_positions(df, mask, search="", sort_col=None, descending=False):
+    """Row positions for the detail table after search and sort."""
+    positions = np.flatnonzero(mask)
+    search = search.strip()
+    if search:
+        matched = np.zeros(len(positions), dtype=bool)
+        for c in DETAIL_SEARCH_COLS:
+            if c in df.columns:
+                matched |= column_contains(df[c], positions, search)
+        positions = positions[matched]
+    if sort_col in df.columns and len(positions):
+        values = df[sort_col].iloc[positions].reset_index(drop=True)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(str).where(values.notna())
+        order = values.sort_values(ascending=not descending, kind="stable", na_position="last").index
+        positions = positions[order.to_numpy()]
+    return positions
+
+def detail_page(df, positions, start):
+    """One page of the detail table, numbered by position in the filtered list."""
+    cols = [c for c in DETAIL_COLS if c in df.columns]
+    page = df.iloc[positions[start:start + DETAIL_PAGE_SIZE]][cols].reset_index(drop=True)
+    page.insert(0, 'SL. NO.', range(start + 1, start + 1 + len(page)))
+    return page
 
 # ================= ADMIN LOGIC FUNCTIONS =================
 def login_callback():
@@ -303,10 +1616,14 @@ def logout_callback():
 def toggle_login():
     st.session_state.show_login = not st.session_state.show_login
 
+def close_exception_view():
+    st.session_state.active_exception_view = None
+
 # ================= LAYOUT LOGIC =================
 
 # 1. Load Configuration
 UNIT_URLS = load_config()
+schedule_refresh({u: dashboard_url(d) for u, d in UNIT_URLS.items()})
 
 if 'selected_months_memory' not in st.session_state:
     # This runs ONLY on the first page load or full browser refresh
@@ -330,14 +1647,25 @@ if st.session_state.admin_logged_in:
     with st.container():
         c_adm1, c_adm2, c_adm3 = st.columns([0.5, 4, 0.5])
         with c_adm2:
+            # Search + paging keep the form small even with hundreds of units
+            unit_search = st.text_input(
+                "🔎 Search Units", key="admin_unit_search", placeholder="Type part of a unit name",
+                on_change=lambda: st.session_state.pop("admin_unit_page", None),  # Back to page 1
+            )
+            matching_units = [u for u in UNIT_URLS if unit_search.strip().lower() in u.lower()]
+            page_count = max(1, -(-len(matching_units) // ADMIN_UNITS_PER_PAGE))
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1, key="admin_unit_page") if page_count > 1 else 1
+            page_units = matching_units[(page - 1) * ADMIN_UNITS_PER_PAGE:page * ADMIN_UNITS_PER_PAGE]
+            st.caption(f"Showing {len(page_units)} of {len(matching_units)} matching units ({len(UNIT_URLS)} total)")
+
             with st.form("admin_link_form"):
-                new_config = {}
-                for unit, details in UNIT_URLS.items():
+                page_edits = {}
+                for unit in page_units:
+                    details = UNIT_URLS[unit]
                     st.markdown(f"### 📂 {unit}")
                     
-                    # Safe get
-                    d_val = details.get("dashboard_url", "") if isinstance(details, dict) else str(details)
-                    e_val = details.get("excel_url", "") if isinstance(details, dict) else ""
+                    d_val = dashboard_url(details)
+                    e_val = excel_url(details)
                     
                     col_d, col_e = st.columns(2)
                     with col_d:
@@ -346,15 +1674,66 @@ if st.session_state.admin_logged_in:
                         e_new = st.text_input("Original Excel Link (Reference)", value=e_val, key=f"{unit}_e")
                     
                     st.markdown("<hr style='margin: 5px 0 15px 0;'>", unsafe_allow_html=True)
-                    new_config[unit] = {"dashboard_url": d_new, "excel_url": e_new}
+                    page_edits[unit] = {"dashboard_url": d_new, "excel_url": e_new}
                 
                 submitted = st.form_submit_button("💾 Save to Cloud", use_container_width=True)
                 
                 if submitted:
-                    save_config(new_config)
-                    st.cache_data.clear() 
+                    # Only the units shown on this page are written back
+                    new_config = {**UNIT_URLS, **page_edits}
+                    save_config(new_config, units=list(page_edits))
+
+                    # Only units whose download link changed are dropped and pre-warmed
+                    old_urls = {u: dashboard_url(d) for u, d in UNIT_URLS.items()}
+                    new_urls = {u: dashboard_url(d) for u, d in new_config.items()}
+                    changed = [u for u in page_edits if new_urls[u] != old_urls.get(u)]
+                    schedule_refresh(new_urls)
+                    prewarm_units(
+                        [new_urls[u] for u in changed],
+                        stale_urls=[old_urls[u] for u in changed if old_urls.get(u) not in new_urls.values()],
+                    )
                     st.success("✅ Links saved to Firebase! These are now permanent.")
 
+            # Per-URL parse engine and timing from the fetch layer
+            with st.expander("📊 Workbook Load Stats"):
+                url_to_unit = {dashboard_url(d): u for u, d in UNIT_URLS.items()}
+                with get_workbook_cache()["lock"]:
+                    load_stats = [
+                        {
+                            "UNIT": url_to_unit.get(url, url),
+                            "ENGINE": e["parse_engine"],
+                            "PARSE (s)": round(e["parse_seconds"], 3),
+                            "SIZE (KB)": round(e["length"] / 1024, 1),
+                            "ROWS": int(e["summary"]["ROWS"].sum()),
+                            "VERSION": e.get("version"),
+                            "LAST DELTA": (
+                                f"+{e['delta']['inserted']} ~{e['delta']['updated']} -{e['delta']['deleted']}"
+                                if e.get("delta") else "full"
+                            ),
+                            "IN MEMORY": "df" in e,
+                        }
+                        for url, e in get_workbook_cache()["entries"].items()
+                    ]
+                if load_stats:
+                    st.dataframe(pd.DataFrame(load_stats), use_container_width=True, hide_index=True)
+                else:
+                    st.info("No workbooks loaded in this process yet.")
+                st.caption(f"🔁 Duplicate loads saved by request coalescing: {get_workbook_cache()['dedup_saved']:,}")
+                view_cache = get_view_cache()
+                st.caption(
+                    f"🧮 Shared view cache: {len(view_cache['entries'])} view(s), "
+                    f"{view_cache['bytes'] / (1024 * 1024):,.1f} MB of {VIEW_CACHE_MAX_MB} MB, "
+                    f"{view_cache['hits']:,} hits / {view_cache['misses']:,} misses"
+                )
+
+            # Snapshot cache housekeeping
+            snap_files = list_snapshots()
+            snap_mb = sum(size for _, size, _ in snap_files) / (1024 * 1024)
+            st.caption(f"🗄️ Snapshot cache: {len(snap_files)} file(s), {snap_mb:,.1f} MB of {SNAPSHOT_MAX_MB} MB")
+            if st.button("🧹 Purge Snapshot Cache", use_container_width=True):
+                removed = purge_snapshots()
+                st.success(f"✅ Removed {removed} snapshot(s).")
+
             st.markdown("<br>", unsafe_allow_html=True)
             if st.button("⬅️ Logout & Return to Dashboard", use_container_width=True):
                 logout_callback()
@@ -386,7 +1765,6 @@ else:
         st.session_state.active_exception_view = None
 
     now_dt = datetime.now()
-    now_str = now_dt.strftime("%d-%b-%Y %I:%M %p")
 
     # ================= HEADER LAYOUT =================
     c_header, c_unit, c_gear = st.columns([5.5, 2, 0.5], gap="small")
@@ -402,35 +1780,47 @@ else:
             toggle_login()
             st.rerun()
 
+    # Load Data (served from the background-refreshed copy, so this is instant after the first load)
+    data_url = dashboard_url(UNIT_URLS.get(selected_unit, {}))
+
+    dataset = load_dataset(data_url)
+    df = dataset["df"] if dataset else pd.DataFrame()
+    as_of = dataset["as_of"] if dataset else None
+    as_of_str = as_of.strftime("%d-%b-%Y %I:%M %p") if as_of else "--"
+    health = fetch_health(data_url)
+    stale_badge = ""
+    if health:
+        stale_badge = f'<span class="stale-badge" title="{html.escape(health["last_error"])}">⚠️ Stale - SharePoint unreachable since {health["since"]:%d-%b %I:%M %p}</span>'
+
     # 3. EXECUTE HEADER TITLE LAST
     with c_header:
         st.markdown(f"""
         <div class="top-ribbon">
             <div class="ribbon-header">
                 <div class="ribbon-title">FCR KNITS - {selected_unit}</div>
-                <div class="ribbon-time">Last Refreshed: {now_str}</div>
+                <div class="ribbon-time">Data as of: {as_of_str}{stale_badge}</div>
             </div>
         </div>
         """, unsafe_allow_html=True)
 
-    # Load Data
-    config_entry = UNIT_URLS.get(selected_unit, {})
-    if isinstance(config_entry, dict):
-        data_url = config_entry.get("dashboard_url", "")
-    else:
-        data_url = str(config_entry)
+    if dataset is None and data_url:
+        st.error("⚠️ Data unavailable - could not reach SharePoint for this unit. Retrying in the background.")
 
-    df = load_data(data_url)
-
-    # ... REST OF YOUR DASHBOARD LOGIC ...
-    if not df.empty:
+    # ================= FRAGMENTS =================
+    # Each section reruns on its own when one of its widgets changes; the header, CSS and
+    # config above only run again on a full rerun (unit switch, refresh, open/close).
+    # Filters, cards, chart and exception details share the filter selection, so they
+    # form one fragment.
+    @st.fragment
+    def unit_dashboard(df, dataset, data_url, selected_unit):
         with st.container():
             st.markdown('<div class="ribbon-filters">', unsafe_allow_html=True)
             f1,f2,f3,f4,f5 = st.columns([1,1,1,1,0.6])
             
             with f1:
                 # 1. Get unique months from data
-                raw_months = [str(m) for m in df['MONTH_STR'].unique() if str(m) != 'nan' and m != "N/A"]
+                filter_index = dataset["filter_index"]
+                raw_months = [m for m in index_options(filter_index, 'MONTH_STR') if m != "N/A"]
                 
                 # 2. Sort months in DESCENDING chronological order
                 # We convert "JAN-26" to a date object to sort correctly, then back to the string
@@ -464,72 +1854,51 @@ else:
                 # Update memory
                 st.session_state.month_memory = sel_month
             
-            dff = df[df['MONTH_STR'].isin(sel_month)] if sel_month else df
-            
-        
+            # Each step narrows a row bitmap; None means every row is still selected
+            row_mask = index_mask(filter_index, 'MONTH_STR', sel_month) if sel_month else None
 
             with f2:
-                buyer_options = sorted([str(b) for b in dff['BUYER'].unique() if str(b) != 'nan'])
+                buyer_options = index_options(filter_index, 'BUYER', row_mask)
                 sel_buyer = st.multiselect("👤 Buyer", buyer_options, default=[], placeholder="All Buyers")
             
-            dff = dff[dff['BUYER'].astype(str).isin(sel_buyer)] if sel_buyer else dff
+            row_mask = index_mask(filter_index, 'BUYER', sel_buyer, row_mask) if sel_buyer else row_mask
 
             with f3:
-                status_options = sorted([str(s) for s in dff['STATUS'].unique() if str(s) != 'nan'])
+                status_options = index_options(filter_index, 'STATUS', row_mask)
                 s_default = ["Completed"] if "Completed" in status_options else []
                 sel_status = st.multiselect("📌 Status", status_options, default=s_default, placeholder="All Status")
             
-            dff = dff[dff['STATUS'].astype(str).isin(sel_status)] if sel_status else dff
+            row_mask = index_mask(filter_index, 'STATUS', sel_status, row_mask) if sel_status else row_mask
 
             with f4:
-                style_options = sorted([str(st_no) for st_no in dff['STYLE NO'].unique() if str(st_no) != 'nan'])
-                sel_style = st.multiselect("👕 Style", style_options, default=[], placeholder="All Styles")
+                # Only the best matches for the typed text are sent to the browser, never every style
+                style_query = st.text_input("👕 Style", key="style_query", placeholder="Type to search styles")
+                style_matches = index_search(filter_index, 'STYLE NO', style_query,
+                                             index_available(filter_index, 'STYLE NO', row_mask))
+                kept = [v for v in st.session_state.get("style_selector", []) if v not in style_matches]
+                sel_style = st.multiselect("Style", kept + style_matches, default=[], key="style_selector",
+                                           placeholder="All Styles", label_visibility="collapsed")
             
-            dff = dff[dff['STYLE NO'].astype(str).isin(sel_style)] if sel_style else dff
+            row_mask = index_mask(filter_index, 'STYLE NO', sel_style, row_mask) if sel_style else row_mask
 
             with f5:
                 st.markdown("<div style='height:35px'></div>", unsafe_allow_html=True)
                 
                 # Button 1: Refresh
                 if st.button("🔄 Refresh", use_container_width=True):
-                    st.cache_data.clear()
+                    with st.spinner(f"Reloading {selected_unit}..."):
+                        # A user-requested refresh always goes to SharePoint
+                        reload_unit(data_url, force=True)
                     st.session_state.active_exception_view = None
                     st.rerun()
 
                 
 
-        # Calculations
-        sum_cut = dff['CUT QTY'].sum()
-        sum_cancut = dff['CAN CUT QTY'].sum()
-        sum_ord = dff['ORD QTY'].sum()
-        sum_req = dff['FAB Req'].sum()
-        sum_rcvd = dff['FAB RCVD'].sum()
-        sum_used = dff['FABRIC USED'].sum() if 'FABRIC USED' in dff.columns else 0
-        sum_stock = dff['FABRIC LEFTOVER STOCK'].sum()
-        
-        # Weighted/Total Based Formulas
-        # 1. STD Cons: (Sum of FAB Req) / (Sum of ORD QTY)
-        avg_std = (sum_req / sum_ord) if sum_ord > 0 else 0
-
-        # 2. CAD Cons: Sum of (CAD Cons * ORD QTY) / Sum of ORD QTY
-        # We calculate row-wise multiplication first, then sum
-        cad_weighted_sum = (dff['CAD Cons'] * dff['ORD QTY']).sum()
-        avg_cad = (cad_weighted_sum / sum_ord) if sum_ord > 0 else 0
-
-        # 3. Factory Achieved Cons: (Sum of FABRIC USED) / (Sum of CUT QTY)
-        avg_ach = (sum_used / sum_cut) if sum_cut > 0 else 0
-
-        # (Keep these as they were or adjust if needed)
-        avg_cancut_p = dff['CAN CUT %'].mean()*100 if not dff.empty else 0
-        avg_cut_p = dff['CUT %'].mean()*100 if not dff.empty else 0
-
-        perf_cut = (sum_cut/sum_cancut*100) if sum_cancut>0 else 0
-        perf_rcvd = (sum_rcvd/sum_req*100) if sum_req>0 else 0
-        perf_cons = avg_ach-avg_std
-
-        ex1_count = len(dff[dff['CUT %'] < 1])
-        ex2_count = len(dff[(dff['CAN CUT %'] < 1.01) & (dff['CUT %'] < 1.01)]) # Updated
-        ex3_count = len(dff[(dff['CUT %'] < dff['CAN CUT %']) & (dff['CUT %'] < 1.01)]) # Updated
+        # Calculations (shared across sessions for the same unit, data version and filters)
+        view = cached_view(data_url, dataset, (sel_month, sel_buyer, sel_status, sel_style), row_mask)
+        kpis = view["kpis"]
+        red = kpis['red']
+        ex1_count, ex2_count, ex3_count = (kpis['ex_counts'][v] for v in ('ex1', 'ex2', 'ex3'))
         
         def fmt(v): return str(v) if v>0 else "--"
 
@@ -541,28 +1910,27 @@ else:
         
         # --- Logic for Text Colors ---
         # Quantity
-        cp_color = txt_green if perf_cut >= 100 else txt_red
+        cp_color = txt_red if red['perf_cut'] else txt_green
         ord_color = txt_green 
-        cc_color = txt_green if avg_cancut_p > 100 else (txt_amber if avg_cancut_p == 100 else txt_red)
-        cut_color = txt_green if avg_cut_p >= avg_cancut_p else txt_red
+        cc_color = txt_red if red['cancut'] else (txt_amber if kpis['avg_cancut_p'] == 100 else txt_green)
+        cut_color = txt_red if red['cut'] else txt_green
 
         # Fabric
         req_color = txt_black
-        rcvd_color = txt_green if sum_rcvd >= sum_req else txt_red
+        rcvd_color = txt_red if red['rcvd'] else txt_green
         used_color = txt_black
-        stock_color = txt_green if sum_stock >= 0 else txt_red
+        stock_color = txt_red if red['stock'] else txt_green
 
         # Consumption
         std_color = txt_black
-        cad_color = txt_green if avg_cad <= avg_std else txt_red
-        ach_color = txt_green if avg_ach <= avg_std else txt_red
-        cons_color = txt_red if perf_cons > 0 else txt_green
+        cad_color = txt_red if red['cad'] else txt_green
+        ach_color = txt_red if red['ach'] else txt_green
+        cons_color = txt_red if red['cons'] else txt_green
 
         # --- ALERT FLAGS (Trigger if ANY value in the card is RED) ---
-        # Checks if any of the text colors assigned to the metrics equal the red constant
-        alert_qty = (cp_color == txt_red) or (cc_color == txt_red) or (cut_color == txt_red)
-        alert_fab = (rcvd_color == txt_red) or (stock_color == txt_red)
-        alert_cons = (cad_color == txt_red) or (ach_color == txt_red) or (cons_color == txt_red)
+        alert_qty = kpis['alerts']['qty']
+        alert_fab = kpis['alerts']['fab']
+        alert_cons = kpis['alerts']['cons']
 
         # Helper to Render Group Card
         def render_group_card(title, metrics, alert_trigger=False):
@@ -589,27 +1957,27 @@ else:
 
         with c_qty:
             render_group_card("Quantity", [
-                ("Can Cut Performance", f"{perf_cut:,.2f}%", cp_color, "Formula: (Total Cut Qty / Total Can Cut Qty) * 100"),
-                ("Order Qty", f"{sum_ord:,.0f}", ord_color, "Total Order Quantity of selected filters"),
-                ("Can Cut Qty", f"{sum_cancut:,.0f} ({avg_cancut_p:.2f}%)", cc_color, "Total Quantity feasible to cut based on Fabric Availability"),
-                ("Cut Qty", f"{sum_cut:,.0f} ({avg_cut_p:.2f}%)", cut_color, "Total Actual Cut Quantity produced")
+                ("Can Cut Performance", f"{kpis['perf_cut']:,.2f}%", cp_color, "Formula: (Total Cut Qty / Total Can Cut Qty) * 100"),
+                ("Order Qty", f"{kpis['sum_ord']:,.0f}", ord_color, "Total Order Quantity of selected filters"),
+                ("Can Cut Qty", f"{kpis['sum_cancut']:,.0f} ({kpis['avg_cancut_p']:.2f}%)", cc_color, "Total Quantity feasible to cut based on Fabric Availability"),
+                ("Cut Qty", f"{kpis['sum_cut']:,.0f} ({kpis['avg_cut_p']:.2f}%)", cut_color, "Total Actual Cut Quantity produced")
             ], alert_trigger=alert_qty)
 
         with c_fab:
             render_group_card("Fabric", [
-                ("Fabric Required", f"{sum_req:,.2f}", req_color, "Total Fabric Required for orders"),
-                ("Fabric Received", f"{sum_rcvd:,.2f} ({perf_rcvd:.2f}%)", rcvd_color, "Total Fabric Received from store (Percentage of Required)"),
-                ("Fabric Used", f"{sum_used:,.2f}", used_color, "Total Fabric consumed in cutting"),
-                ("Fabric Leftover", f"{sum_stock:,.2f}", stock_color, "Fabric Remaining Stock (Received - Used)")
+                ("Fabric Required", f"{kpis['sum_req']:,.2f}", req_color, "Total Fabric Required for orders"),
+                ("Fabric Received", f"{kpis['sum_rcvd']:,.2f} ({kpis['perf_rcvd']:.2f}%)", rcvd_color, "Total Fabric Received from store (Percentage of Required)"),
+                ("Fabric Used", f"{kpis['sum_used']:,.2f}", used_color, "Total Fabric consumed in cutting"),
+                ("Fabric Leftover", f"{kpis['sum_stock']:,.2f}", stock_color, "Fabric Remaining Stock (Received - Used)")
             ], alert_trigger=alert_fab)
 
         with c_cons:
-            sym = "+" if perf_cons > 0 else ""
+            sym = "+" if kpis['perf_cons'] > 0 else ""
             render_group_card("Consumption", [
-                ("STD Cons", f"{avg_std:.3f}", std_color, "Average Standard Consumption (Budgeted)"),
-                ("CAD Cons", f"{avg_cad:.3f}", cad_color, "Average CAD Consumption (Marker Plan)"),
-                ("Factory Achieved Cons", f"{avg_ach:.3f}", ach_color, "Average Actual Consumption on Floor"),
-                ("Cons Performance", f"{sym}{perf_cons:.3f}", cons_color, "Difference: Achieved Cons - STD Cons (Positive means excess usage)")
+                ("STD Cons", f"{kpis['avg_std']:.3f}", std_color, "Average Standard Consumption (Budgeted)"),
+                ("CAD Cons", f"{kpis['avg_cad']:.3f}", cad_color, "Average CAD Consumption (Marker Plan)"),
+                ("Factory Achieved Cons", f"{kpis['avg_ach']:.3f}", ach_color, "Average Actual Consumption on Floor"),
+                ("Cons Performance", f"{sym}{kpis['perf_cons']:.3f}", cons_color, "Difference: Achieved Cons - STD Cons (Positive means excess usage)")
             ], alert_trigger=alert_cons)
 
         st.markdown("<div style='height:25px'></div>", unsafe_allow_html=True)
@@ -621,7 +1989,9 @@ else:
             def render_centered_card(bg_class, title, count, btn_key, view_id):
                 st.markdown(f'<div class="exception-card-container {bg_class}"><div class="ex-text-group"><div class="ex-lbl">{title}</div><div class="ex-val">{count}</div></div></div>', unsafe_allow_html=True)
                 st.markdown('<div class="info-btn-css">', unsafe_allow_html=True)
-                if st.button("ⓘ", key=btn_key): st.session_state.active_exception_view = view_id
+                if st.button("ⓘ", key=btn_key):
+                    st.session_state.active_exception_view = view_id
+                    st.session_state.pop("detail_page", None)
                 st.markdown('</div><div class="spacer-area"></div>', unsafe_allow_html=True)
 
             render_centered_card("bg-indigo", "CUT% < 100%", fmt(ex1_count), "btn_ex1", "ex1")
@@ -630,73 +2000,19 @@ else:
             
             # --- SUMMARY BUTTON ---
             st.markdown("<div style='height:10px'></div>", unsafe_allow_html=True)
+            # The summary and trends are their own fragments, so opening them needs a full rerun
             if st.button("📋 View All Units Summary", use_container_width=True):
                 st.session_state.show_summary = True
+                st.rerun()
+            if st.button("📈 View Historical Trends", use_container_width=True):
+                st.session_state.show_trends = True
+                st.rerun()
 
         with c2:
-            if 'BUYER' in dff.columns and not dff.empty:
-                # 1. Faster Aggregation
-                dfc = dff.groupby('BUYER').agg({
-                    'CAN CUT %': 'mean',
-                    'CUT %': 'mean'
-                }).reset_index()
-                
-                dfc['CAN CUT %'] *= 100
-                dfc['CUT %'] *= 100
-                dfc = dfc.sort_values(by='CAN CUT %', ascending=False)
-
-                fig = go.Figure()
-                
-                # 2. Optimized Bar Traces
-                fig.add_trace(go.Bar(
-                    x=dfc['BUYER'], y=dfc['CAN CUT %'], name="Can Cut %", 
-                    marker=dict(color="#2c6e9e"),
-                    text=[f"{v:.1f}%" for v in dfc['CAN CUT %']], textposition="auto",
-                    marker_cornerradius=10
-                ))
-                
-                fig.add_trace(go.Bar(
-                    x=dfc['BUYER'], y=dfc['CUT %'], name="Cut %", 
-                    marker=dict(color="#5fa6e1"),
-                    text=[f"{v:.1f}%" for v in dfc['CUT %']], textposition="auto",
-                    marker_cornerradius=10
-                ))
-
-                fig.add_trace(go.Scatter(
-                    x=dfc['BUYER'], y=dfc['CUT %'], mode='lines+markers', name='Trend',
-                    line=dict(color="#e11d48", width=3),
-                    marker=dict(size=8, color="#e11d48"),
-                    showlegend=False
-                ))
-
-                fig.update_layout(
-                    title=dict(
-                        text="📈 Performance by Buyer", 
-                        font=dict(size=22, color="#1e293b", weight=700),
-                        x=0.01 # Aligns title to the left
-                    ),
-                    hovermode="x unified", 
-                    barmode='group', 
-                    height=400,
-                    # --- INCREASED MARGINS ---
-                    # Increasing 'r' (right) from 10 to 40 prevents clipping
-                    margin=dict(l=20, r=40, t=60, b=20), 
-                    showlegend=True,
-                    # --- ADJUSTED LEGEND ---
-                    # Setting x to 0.98 instead of 1.0 pulls it away from the edge
-                    legend=dict(
-                        orientation="h", 
-                        yanchor="bottom", 
-                        y=1.02, 
-                        xanchor="right", 
-                        x=0.98 
-                    ),
-                    yaxis=dict(showgrid=True, gridcolor='#f1f5f9'),
-                    xaxis=dict(showgrid=False)
-                )
-
+            chart = view["figure"]
+            if chart is not None:
                 # 3. Use 'use_container_width=True' and turn off 'displaylogo'
-                st.plotly_chart(fig, use_container_width=True, config={'displaylogo': False, 'staticPlot': False})
+                st.plotly_chart(chart, use_container_width=True, config={'displaylogo': False, 'staticPlot': False})
             else:
                 st.info("No data available for the selected filters.")
 
@@ -713,54 +2029,58 @@ else:
                 height=0,
                 width=0
             )
-            detail_df = pd.DataFrame()
-            view_title = ""
-            view_color = ""
-
-            if st.session_state.active_exception_view == 'ex1':
-                detail_df = dff[dff['CUT %'] < 1].copy()
-                view_title = "🚨 Orders with CUT % < 100%"
-                view_color = "#6366f1"
-            elif st.session_state.active_exception_view == 'ex2':
-                # This filter now ensures you only see rows where both percentages are under 101%
-                detail_df = dff[(dff['CAN CUT %'] < 1.01) & (dff['CUT %'] < 1.01)].copy() 
-                view_title = "⚠️ Orders with CAN CUT % < 101% (Excl. Cut >101%)"
-                view_color = "#06b6d4"
-            elif st.session_state.active_exception_view == 'ex3':
-                # Updated filter to exclude anything where CUT % is 101% or higher
-                detail_df = dff[(dff['CUT %'] < dff['CAN CUT %']) & (dff['CUT %'] < 1.01)].copy()
-                view_title = "📉 Orders where CUT % < CAN CUT % (Excl. >101%)"
-                view_color = "#10b981"
-
-            if not detail_df.empty:
-                detail_df.reset_index(drop=True, inplace=True)
-                detail_df.insert(0, 'SL. NO.', range(1, 1 + len(detail_df)))
-
-            disp_cols = ['SL. NO.', 'BUYER', 'STYLE NO', 'COLOUR', 'ORD QTY', 'CAN CUT %', 'CUT %', 'FABRIC LEFTOVER STOCK', 'REMARKS']
-            final_cols = [c for c in disp_cols if c in detail_df.columns]
+            view_title, view_color = {
+                'ex1': ("🚨 Orders with CUT % < 100%", "#6366f1"),
+                # Only rows where both percentages are under 101%
+                'ex2': ("⚠️ Orders with CAN CUT % < 101% (Excl. Cut >101%)", "#06b6d4"),
+                # Excludes anything where CUT % is 101% or higher
+                'ex3': ("📉 Orders where CUT % < CAN CUT % (Excl. >101%)", "#10b981"),
+            }[st.session_state.active_exception_view]
+            ex_mask = kpis['ex_masks'][st.session_state.active_exception_view]
+            ex_total = kpis['ex_counts'][st.session_state.active_exception_view]
 
             h1, h2 = st.columns([4, 1])
             with h1:
-                st.markdown(f"<h3 style='color:{view_color};'>{view_title} ({len(detail_df)} Records)</h3>", unsafe_allow_html=True)
+                st.markdown(f"<h3 style='color:{view_color};'>{view_title} ({ex_total} Records)</h3>", unsafe_allow_html=True)
             with h2:
-                if st.button("❌ Close Details", use_container_width=True):
-                    st.session_state.active_exception_view = None
-                    st.rerun()
+                # A callback, not a fragment rerun: the click may be handled in a full-app run
+                st.button("❌ Close Details", on_click=close_exception_view, use_container_width=True)
+
+            if ex_total:
+                # Search, sort and paging run on row positions; only the visible page is copied and styled
+                def reset_page():
+                    st.session_state.pop("detail_page", None)  # Back to page 1
+
+                d1, d2, d3 = st.columns([3, 2, 1])
+                with d1:
+                    detail_search = st.text_input("🔍 Search Buyer / Style / Remarks", key="detail_search", on_change=reset_page)
+                with d2:
+                    detail_sort = st.selectbox("Sort by", ["Workbook order"] + DETAIL_SORT_COLS, key="detail_sort", on_change=reset_page)
+                with d3:
+                    st.markdown("<div style='height:28px'></div>", unsafe_allow_html=True)
+                    detail_desc = st.checkbox("Descending", key="detail_desc", on_change=reset_page)
+
+                positions = detail_positions(df, ex_mask, detail_search,
+                                             None if detail_sort == "Workbook order" else detail_sort, detail_desc)
+                pages = max(1, -(-len(positions) // DETAIL_PAGE_SIZE))
+                page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1, key="detail_page")
+                start = (page - 1) * DETAIL_PAGE_SIZE
+                page_df = detail_page(df, positions, start)
+                st.caption(f"Showing {start + 1 if len(page_df) else 0}–{start + len(page_df)} of {len(positions):,} matching rows (page {page} of {pages})")
 
-            if not detail_df.empty:
                 def color_red_if_low(val):
                     if isinstance(val, (int, float)) and val < 1.0:
                         return 'color: #dc2626; font-weight: bold;'
                     return ''
 
-                styled_df = detail_df[final_cols].style.format({
+                styled_df = page_df.style.format({
                     'SL. NO.': '{:.0f}',
                     'ORD QTY': '{:,.0f}',
                     'FABRIC LEFTOVER STOCK': '{:,.2f}',
                     'CAN CUT %': '{:.2%}',
                     'CUT %': '{:.2%}'
                 })\
-                .map(color_red_if_low, subset=['CAN CUT %', 'CUT %'])\
+                .map(color_red_if_low, subset=[c for c in ['CAN CUT %', 'CUT %'] if c in page_df.columns])\
                 .set_properties(**{'background-color': '#f8fafc', 'color': '#000080', 'border-color': '#cbd5e1'})
 
                 st.dataframe(
@@ -774,9 +2094,11 @@ else:
             else:
                 st.success("✅ No exceptions found!")
 
-        # ----------------------------------------------------------------
-        # 🔥 GLOBAL SUMMARY TABLE (WITH STATUS FILTER)
-        # ----------------------------------------------------------------
+    # ----------------------------------------------------------------
+    # 🔥 GLOBAL SUMMARY TABLE (WITH STATUS FILTER)
+    # ----------------------------------------------------------------
+    @st.fragment
+    def all_units_summary():
         if st.session_state.show_summary:
             st.markdown("---")
             st.markdown('<div id="summary_target"></div>', unsafe_allow_html=True)
@@ -792,23 +2114,23 @@ else:
             st.subheader("🌍 All Units Summary Report")
             
             with st.spinner("Compiling data from all units..."):
-                all_units_data = {}
+                # Only the small per-unit (month, week, status) tables are needed here, not the raw rows
+                unit_tables = {}
                 all_months = set()
                 
-                # 1. FIRST PASS: Load all data and identify available Months
-                for unit_name, config in UNIT_URLS.items():
-                    u_url = config.get("dashboard_url", "") if isinstance(config, dict) else str(config)
-                    u_df = load_data(u_url)
-                    
-                    if not u_df.empty:
-                        # Ensure END DATE is datetime and create Week/Month strings from it
-                        u_df['END DATE'] = pd.to_datetime(u_df['END DATE'], errors='coerce')
-                        u_df['MONTH_STR'] = u_df['END DATE'].dt.strftime('%b-%y').str.upper()
-                        # Create Week string directly from END DATE (e.g., WK01, WK52)
-                        u_df['WEEK_FMT'] = u_df['END DATE'].dt.isocalendar().week.apply(lambda x: f"WK{int(x):02d}" if pd.notnull(x) else "N/A")
-                        
-                        all_units_data[unit_name] = u_df
-                        all_months.update(u_df['MONTH_STR'].dropna().unique())
+                # 1. FIRST PASS: Load all units in parallel and identify available Months
+                summary_urls = {unit_name: dashboard_url(config) for unit_name, config in UNIT_URLS.items()}
+                load_progress = st.progress(0.0, text="Loading units...")
+                for done, (unit_name, u_data) in enumerate(load_units(summary_urls), start=1):
+                    load_progress.progress(done / len(summary_urls), text=f"Loaded {unit_name} ({done}/{len(summary_urls)})")
+
+                    if u_data and len(u_data["summary"]):
+                        unit_tables[unit_name] = u_data["summary"]
+                        all_months.update(m for m in u_data["summary"]['MONTH_STR'].dropna().unique() if m != "N/A")
+                load_progress.empty()
+
+                # Keep the configured unit order regardless of which download finished first
+                unit_tables = {u: unit_tables[u] for u in summary_urls if u in unit_tables}
 
                 # 2. RENDER MONTH FILTER FIRST
                 sf1, sf2, sf3 = st.columns(3)
@@ -836,9 +2158,8 @@ else:
 
                 # 3. SECOND PASS: Identify weeks ONLY for the selected months
                 available_weeks = set()
-                for u_df in all_units_data.values():
-                    filtered_by_month = u_df[u_df['MONTH_STR'].isin(summ_sel_month)] if summ_sel_month else u_df
-                    available_weeks.update(filtered_by_month['WEEK_FMT'].unique())
+                for table in unit_tables.values():
+                    available_weeks.update(filter_cube(table, months=summ_sel_month)['WEEK_FMT'].unique())
                 
                 if "N/A" in available_weeks: available_weeks.remove("N/A")
 
@@ -849,43 +2170,21 @@ else:
                 
                 # Get statuses for the selected month/week
                 all_statuses = set()
-                for u_df in all_units_data.values():
-                    temp = u_df[u_df['MONTH_STR'].isin(summ_sel_month)] if summ_sel_month else u_df
-                    if summ_sel_week:
-                        temp = temp[temp['WEEK_FMT'].isin(summ_sel_week)]
+                for table in unit_tables.values():
+                    temp = filter_cube(table, months=summ_sel_month, weeks=summ_sel_week)
                     all_statuses.update(temp['STATUS'].dropna().unique())
 
                 with sf3:
                     summ_sel_status = st.multiselect("3. Select Status", sorted(list(all_statuses)), default=["Completed"] if "Completed" in all_statuses else [])
 
                 # 4. AGGREGATE DATA
-                # 5. FINAL AGGREGATION
+                # 5. FINAL AGGREGATION (sums over the pre-aggregated tables, then the weighted formulas)
                 summary_rows = []
-                for unit_name, u_df in all_units_data.items():
-                    temp_df = u_df.copy()
-                    
-                    # Apply the dynamic filters
-                    if summ_sel_month:
-                        temp_df = temp_df[temp_df['MONTH_STR'].isin(summ_sel_month)]
-                    if summ_sel_week:
-                        temp_df = temp_df[temp_df['WEEK_FMT'].isin(summ_sel_week)]
-                    if summ_sel_status:
-                        temp_df = temp_df[temp_df['STATUS'].isin(summ_sel_status)]
-                    
-                    if not temp_df.empty:
-                        # (Keep your existing weighted calculation logic here)
-                        s_ord = temp_df['ORD QTY'].sum()
-                        s_req = temp_df['FAB Req'].sum()
-                        
-                        summary_rows.append({
-                            "UNIT NAME": unit_name,
-                            "ORD QTY": s_ord,
-                            "STD Cons": (s_req / s_ord) if s_ord > 0 else 0,
-                            "CAD Cons": ((temp_df['CAD Cons'] * temp_df['ORD QTY']).sum() / s_ord) if s_ord > 0 else 0,
-                            "CAN CUT %": temp_df['CAN CUT %'].mean(), 
-                            "CUT %": temp_df['CUT %'].mean(),
-                            "LEFTOVER STOCK": temp_df['FABRIC LEFTOVER STOCK'].sum()
-                        })
+                for unit_name, table in unit_tables.items():
+                    temp = filter_cube(table, months=summ_sel_month, weeks=summ_sel_week, statuses=summ_sel_status)
+                    totals = {c: temp[c].sum() for c in SUMMARY_SUM_COLS}
+                    if totals['ROWS'] > 0:
+                        summary_rows.append(summary_row(unit_name, totals))
 
                 # 5. DISPLAY TABLE (Light Blue Style)
                 if summary_rows:
@@ -911,3 +2210,74 @@ else:
             if st.button("❌ Close Summary", key="close_summ_btn"):
                 st.session_state.show_summary = False
                 st.rerun()
+
+    # ----------------------------------------------------------------
+    # 📈 HISTORICAL TRENDS (FROM THE LOCAL HISTORY STORE)
+    # ----------------------------------------------------------------
+    @st.fragment
+    def historical_trends():
+        if st.session_state.show_trends:
+            st.markdown("---")
+            st.subheader("📈 Historical Trends")
+            # (column, divisor column, scale): percentages average per row and Achieved Cons is
+            # sum(FABRIC USED) / sum(CUT QTY), the same formulas the cards use
+            trend_metrics = {
+                "Can Cut %": ("CAN CUT %", None, 100),
+                "Cut %": ("CUT %", None, 100),
+                "Achieved Cons": ("FABRIC USED", "CUT QTY", 1),
+            }
+
+            tf1, tf2, tf3 = st.columns(3)
+            with tf1:
+                trend_units = st.multiselect("Units", list(UNIT_URLS), default=list(UNIT_URLS), key="trend_units")
+            # Month choices come from partition folder names; no data file is opened for them
+            archived_months = history_months(trend_units)
+            with tf2:
+                trend_months = st.multiselect(
+                    "Months", archived_months, default=archived_months[-12:], key="trend_months",
+                    format_func=lambda m: datetime.strptime(m, "%Y-%m").strftime("%b-%y").upper(),
+                )
+            with tf3:
+                trend_metric = st.selectbox("Metric", list(trend_metrics), key="trend_metric")
+
+            metric_col, per_col, scale = trend_metrics[trend_metric]
+            hist = read_history(trend_units, trend_months, [metric_col] + ([per_col] if per_col else []))
+            if hist.empty:
+                st.info("No history archived yet for the selected units and months.")
+            else:
+                grouped = hist.groupby(['unit', 'month'])
+                if per_col:
+                    sums = grouped[[metric_col, per_col]].sum()
+                    values = sums[metric_col] / sums[per_col].where(sums[per_col] > 0)
+                else:
+                    values = grouped[metric_col].mean()
+                trend = values.rename(metric_col).reset_index().sort_values('month')
+                trend['label'] = pd.to_datetime(trend['month']).dt.strftime('%b-%y').str.upper()
+                import plotly.graph_objects as go
+                fig = go.Figure()
+                for unit_name in trend_units:
+                    unit_trend = trend[trend['unit'] == unit_name]
+                    if unit_trend.empty:
+                        continue
+                    fig.add_trace(go.Scatter(
+                        x=unit_trend['label'],
+                        y=unit_trend[metric_col] * scale,
+                        mode="lines+markers", name=unit_name,
+                    ))
+                fig.update_layout(
+                    hovermode="x unified",
+                    height=400,
+                    margin=dict(l=20, r=40, t=30, b=20),
+                    xaxis=dict(type="category", categoryorder="array", categoryarray=trend['label'].unique()),
+                    yaxis=dict(title=trend_metric),
+                )
+                st.plotly_chart(fig, use_container_width=True, config={'displaylogo': False})
+
+            if st.button("❌ Close Trends", key="close_trends_btn"):
+                st.session_state.show_trends = False
+                st.rerun()
+
+    if not df.empty:
+        unit_dashboard(df, dataset, data_url, selected_unit)
+        all_units_summary()
+        historical_trends()
@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DASHBOARD = os.path.join(ROOT, "dashboard.py")
+
+
+@pytest.fixture(scope="session")
+def dashboard(tmp_path_factory):
+    """dashboard.py's helpers (everything above the layout), executed outside `streamlit run`."""
+    cache_dir = tmp_path_factory.mktemp("fcr_cache")
+    os.environ["FCR_SNAPSHOT_DIR"] = str(cache_dir / "snapshots")
+    os.environ["FCR_HISTORY_DIR"] = str(cache_dir / "history")
+    os.environ["FCR_SHARED_CACHE"] = "none"
+    with open(DASHBOARD, encoding="utf-8") as f:
+        source = f.read()
+    source = source[:source.index("# ================= LAYOUT LOGIC")]
+    module = types.ModuleType("dashboard")
+    module.__file__ = DASHBOARD
+    sys.modules["dashboard"] = module
+    exec(compile(source, DASHBOARD, "exec"), module.__dict__)
+    return module
+
+
+BODY = b"x" * 4096
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Plays back `server.script`, one behaviour per request, repeating the last one.
+
+    "ok" answers with `server.body`; the other modes fail in the ways SharePoint has.
+    """
+
+    def do_GET(self):
+        script = self.server.script
+        mode = script[min(self.server.hits, len(script) - 1)]
+        self.server.hits += 1
+        if mode == "ok":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(self.server.body)))
+            self.end_headers()
+            self.wfile.write(self.server.body)
+        elif mode == "503":
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif mode == "trickle":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            try:
+                for i in range(len(BODY)):
+                    self.wfile.write(BODY[i:i + 1])
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            except OSError:
+                pass
+        elif mode == "chunked-broken":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"10\r\nonly-half")
+            self.wfile.flush()
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    httpd.script, httpd.hits, httpd.body = ["ok"], 0, BODY
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fresh_cache(dashboard, shared=None):
+    """A workbook cache shaped like get_workbook_cache()'s, private to one test."""
+    return {
+        "lock": threading.Lock(),
+        "entries": {},
+        "inflight": {},
+        "dedup_saved": 0,
+        "breakers": {},
+        "unit_names": {},
+        "shared": shared or dashboard.make_shared_cache(),
+        "history_pool": dashboard.ThreadPoolExecutor(max_workers=1),
+    }
+
+
+def url_of(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/FCR.xlsx"
@@ -0,0 +1,205 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self, timeout=None):
+        self.collection.db.reads += 1
+        return FakeSnapshot(self.id, self.collection.docs.get(self.id))
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.docs = {}
+        self.listeners = []
+
+    def get(self, timeout=None):
+        self.db.reads += 1
+        if self.db.unreachable:
+            raise TimeoutError("deadline exceeded")
+        return [FakeSnapshot(i, d) for i, d in self.docs.items()]
+
+    def document(self, doc_id):
+        return FakeDocument(self, doc_id)
+
+    def list_documents(self):
+        return [FakeDocument(self, i) for i in self.docs]
+
+    def on_snapshot(self, callback):
+        if self.db.listener_fails:
+            raise RuntimeError("listen stream unavailable")
+        self.listeners.append(callback)
+        return object()
+
+    def push(self):
+        """Deliver the current documents to every listener, as Firestore does after a change."""
+        for callback in self.listeners:
+            callback(self.get(), [], datetime.now())
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, payload):
+        self.ops.append((ref, payload))
+
+    def delete(self, ref):
+        self.ops.append((ref, None))
+
+    def commit(self):
+        self.db.commits.append(len(self.ops))
+        for ref, payload in self.ops:
+            if payload is None:
+                ref.collection.docs.pop(ref.id, None)
+            else:
+                ref.collection.docs[ref.id] = payload
+
+
+class FakeFirestore:
+    """In-memory stand-in for the few Firestore client calls the config code makes."""
+
+    def __init__(self):
+        self.collections = {}
+        self.reads = 0
+        self.commits = []
+        self.unreachable = False
+        self.listener_fails = False
+
+    def collection(self, name):
+        return self.collections.setdefault(name, FakeCollection(self, name))
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def unit(i):
+    return {"dashboard_url": f"https://example.com/{i}.xlsx", "excel_url": f"https://example.com/{i}"}
+
+
+@pytest.fixture
+def config(dashboard, tmp_path, monkeypatch):
+    """The config functions wired to a fake Firestore, a fresh store and a temporary local copy."""
+    db = FakeFirestore()
+    monkeypatch.setattr(dashboard, "LOCAL_CONFIG_PATH", str(tmp_path / "unit_config.json"))
+    build_store = dashboard.get_config_store.__wrapped__
+    stores = []
+
+    def get_config_store():
+        # Built on first use like the cached original, but fresh for every test
+        if not stores:
+            stores.append(build_store())
+        return stores[0]
+
+    monkeypatch.setattr(dashboard, "get_db", lambda: db)
+    monkeypatch.setattr(dashboard, "get_config_store", get_config_store)
+    monkeypatch.setattr(dashboard, "db", db, raising=False)  # The fake, for assertions
+    return dashboard
+
+
+def seed(db, units):
+    units_ref = db.collection("unit_configs")
+    for order, (name, details) in enumerate(units.items()):
+        units_ref.docs[name] = {**details, "order": order}
+
+
+def test_one_read_per_process_once_listening(config):
+    seed(config.db, {"B": unit(2), "A": unit(1)})
+    first = config.load_config()
+    for _ in range(5):
+        assert config.load_config() is first
+    assert config.db.reads == 1
+    assert list(first) == ["B", "A"]  # document order, not name order
+
+
+def test_listener_updates_every_reader(config):
+    seed(config.db, {"A": unit(1)})
+    config.load_config()
+    version = config.get_config_store()["version"]
+    config.db.collection("unit_configs").docs["C"] = {**unit(3), "order": 1}
+    config.db.collection("unit_configs").push()
+    assert list(config.load_config()) == ["A", "C"]
+    assert config.get_config_store()["version"] == version + 1
+    with open(config.LOCAL_CONFIG_PATH) as f:
+        assert list(json.load(f)) == ["A", "C"]
+
+
+def test_ttl_rereads_when_listener_fails(config):
+    config.db.listener_fails = True
+    seed(config.db, {"A": unit(1)})
+    config.load_config()
+    config.load_config()
+    assert config.db.reads == 1
+    store = config.get_config_store()
+    store["checked_at"] = datetime.now() - timedelta(seconds=config.CONFIG_TTL_SEC + 1)
+    config.db.collection("unit_configs").docs["B"] = {**unit(2), "order": 1}
+    assert list(config.load_config()) == ["A", "B"]
+    assert config.db.reads == 2
+
+
+def test_local_copy_served_when_firestore_times_out(config):
+    with open(config.LOCAL_CONFIG_PATH, "w") as f:
+        json.dump({"LOCAL": unit(9)}, f)
+    config.db.unreachable = True
+    assert list(config.load_config()) == ["LOCAL"]
+    # The failed read still counts as a check, so reruns don't retry until the TTL passes
+    config.load_config()
+    assert config.db.reads == 1
+
+
+def test_defaults_served_without_local_copy(config):
+    config.db.unreachable = True
+    assert config.load_config() == config.DEFAULT_URLS
+    assert not os.path.exists(config.LOCAL_CONFIG_PATH)
+
+
+def test_legacy_document_is_migrated_to_unit_documents(config):
+    legacy = {"Z": unit(26), "A": unit(1), "OLD": "https://example.com/bare.xlsx"}
+    config.db.collection("settings").docs["unit_config"] = legacy
+    config.load_config()
+    docs = config.db.collection("unit_configs").docs
+    assert [(name, d["order"]) for name, d in docs.items()] == [("Z", 0), ("A", 1), ("OLD", 2)]
+    assert docs["OLD"] == {"dashboard_url": "https://example.com/bare.xlsx", "excel_url": "", "order": 2}
+    assert config.load_config() == legacy
+
+
+def test_writes_are_batched_and_scoped(config, monkeypatch):
+    monkeypatch.setattr(config, "FIRESTORE_BATCH_LIMIT", 2)
+    units = {f"U{i}": unit(i) for i in range(5)}
+    config.save_config(units)
+    assert config.db.commits == [2, 2, 1]
+    assert list(config.db.collection("unit_configs").docs) == list(units)
+
+    # An admin page save writes only the edited units
+    config.db.commits.clear()
+    edited = {**units, "U3": unit(33)}
+    config.save_config(edited, units=["U3"])
+    assert config.db.commits == [1]
+    assert config.db.collection("unit_configs").docs["U3"]["dashboard_url"] == unit(33)["dashboard_url"]
+
+    # A full save deletes documents for units that were removed
+    config.db.commits.clear()
+    config.save_config({"U0": unit(0)})
+    assert list(config.db.collection("unit_configs").docs) == ["U0"]
+    assert config.db.commits == [2, 2, 1]
+    assert config.load_config() == {"U0": unit(0)}
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from test_kpis import make_frame
+
+
+@pytest.fixture
+def delta_mode(dashboard, monkeypatch):
+    monkeypatch.setattr(dashboard, "INGEST_MODE", "delta")
+    return dashboard
+
+
+def recategorise(dashboard, df):
+    """Categories as a fresh parse would build them for this frame."""
+    df = df.reset_index(drop=True)
+    for c in dashboard.DIM_COLS:
+        df[c] = df[c].astype(str).where(df[c].notna()).astype('category')
+    return df
+
+
+def edited(dashboard, old):
+    """Next workbook version: some lines updated, some deleted, new lines incl. a new buyer."""
+    new = old.astype({c: object for c in dashboard.DIM_COLS})
+    new.loc[10:19, 'CUT QTY'] += 7
+    new.loc[20:24, 'CUT %'] = 0.5
+    new = new.drop(index=range(30, 40))
+    added = new.iloc[:6].copy()
+    added['BUYER'] = "NEW BUYER"
+    added['STYLE NO'] = [f"NEW{i}" for i in range(6)]
+    return recategorise(dashboard, pd.concat([new, added]))
+
+
+def assert_tables_match(dashboard, got, expected, dims):
+    def normalised(table):
+        table = table.astype({d: str for d in dims}).sort_values(dims).reset_index(drop=True)
+        return table[expected.columns]
+    pd.testing.assert_frame_equal(normalised(got), normalised(expected), check_dtype=False,
+                                  check_categorical=False, rtol=1e-9, atol=1e-9)
+
+
+def test_delta_matches_full_rebuild(delta_mode):
+    d = delta_mode
+    old = make_frame(d, 400)
+    entry = {"df": old, **d.build_derived(old)}
+    new = edited(d, old)
+
+    derived = d.ingest_delta(entry, new)
+    full = d.build_derived(new)
+    assert derived["delta"] == {"inserted": 6, "updated": 15, "deleted": 10, "unchanged": 375}
+    assert_tables_match(d, derived["cube"], full["cube"], d.CUBE_DIMS)
+    assert_tables_match(d, derived["summary"], full["summary"], d.SUMMARY_DIMS)
+    assert np.array_equal(derived["row_keys"], full["row_keys"])
+    assert "NEW BUYER" in set(derived["cube"]['BUYER'])
+
+
+def test_unchanged_workbook_is_an_empty_delta(delta_mode):
+    d = delta_mode
+    old = make_frame(d, 200)
+    entry = {"df": old, **d.build_derived(old)}
+    derived = d.ingest_delta(entry, recategorise(d, old.copy()))
+    assert derived["delta"] == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 200}
+    assert_tables_match(d, derived["cube"], entry["cube"], d.CUBE_DIMS)
+
+
+def test_large_change_falls_back_to_full_rebuild(delta_mode, monkeypatch):
+    d = delta_mode
+    old = make_frame(d, 200)
+    entry = {"df": old, **d.build_derived(old)}
+    new = make_frame(d, 200, seed=99)
+    derived = d.ingest_delta(entry, new)
+    assert derived["delta"] is None
+    assert_tables_match(d, derived["cube"], d.build_derived(new)["cube"], d.CUBE_DIMS)
+
+    # Below the threshold the same edit is applied as a delta
+    monkeypatch.setattr(d, "DELTA_MAX_FRACTION", 0.5)
+    small = edited(d, old)
+    assert d.ingest_delta(entry, small)["delta"] is not None
+    monkeypatch.setattr(d, "DELTA_MAX_FRACTION", 0.05)
+    assert d.ingest_delta(entry, small)["delta"] is None
+
+
+def test_entry_without_fingerprints_rebuilds(dashboard):
+    old = make_frame(dashboard, 100)
+    entry = {"df": old, **dashboard.build_derived(old)}  # Built in full mode: no row keys
+    derived = dashboard.ingest_delta(entry, old)
+    assert derived["delta"] is None
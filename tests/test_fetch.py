@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from conftest import BODY, fresh_cache, url_of
+
+
+@pytest.fixture
+def fast_backoff(dashboard, monkeypatch):
+    monkeypatch.setattr(dashboard, "HTTP_BACKOFF_SEC", 0.01)
+    return dashboard
+
+
+def test_http_get_returns_body(fast_backoff, server):
+    r, body = fast_backoff.http_get(requests.Session(), url_of(server), {})
+    assert r.status_code == 200
+    assert body == BODY
+
+
+def test_trickling_body_hits_deadline(fast_backoff, server):
+    # Every byte arrives well within the read timeout, so only the wall-clock deadline stops it.
+    server.script = ["trickle"]
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        fast_backoff.http_get(requests.Session(), url_of(server), {}, retries=3, deadline=0.5)
+    assert time.monotonic() - started < 2
+    assert server.hits == 1
+
+
+def test_retry_statuses_are_retried(fast_backoff, server):
+    server.script = ["503", "503", "ok"]
+    r, body = fast_backoff.http_get(requests.Session(), url_of(server), {}, retries=3)
+    assert r.status_code == 200 and body == BODY
+    assert server.hits == 3
+
+
+def test_last_retry_status_is_returned(fast_backoff, server):
+    server.script = ["503"]
+    r, _ = fast_backoff.http_get(requests.Session(), url_of(server), {}, retries=1)
+    assert r.status_code == 503
+    assert server.hits == 2
+
+
+def test_broken_chunked_body_is_retried(fast_backoff, server):
+    server.script = ["chunked-broken", "ok"]
+    r, body = fast_backoff.http_get(requests.Session(), url_of(server), {}, retries=1)
+    assert body == BODY
+    assert server.hits == 2
+
+
+def test_broken_chunked_body_raises_when_out_of_retries(fast_backoff, server):
+    server.script = ["chunked-broken"]
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        fast_backoff.http_get(requests.Session(), url_of(server), {}, retries=0)
+
+
+def test_interactive_fetch_uses_fewer_retries(fast_backoff, server, monkeypatch):
+    server.script = ["503"]
+    monkeypatch.setattr(fast_backoff, "HTTP_INTERACTIVE_RETRIES", 1)
+    cache = fresh_cache(fast_backoff)
+    with pytest.raises(requests.HTTPError):
+        fast_backoff.fetch_workbook(url_of(server), cache=cache, session=requests.Session())
+    assert server.hits == 2
+
+
+def test_breaker_opens_after_repeated_failures(fast_backoff, server, monkeypatch):
+    server.script = ["503"]
+    monkeypatch.setattr(fast_backoff, "HTTP_INTERACTIVE_RETRIES", 0)
+    cache = fresh_cache(fast_backoff)
+    url = url_of(server)
+    for _ in range(fast_backoff.BREAKER_FAILURES):
+        with pytest.raises(requests.HTTPError):
+            fast_backoff.fetch_workbook(url, cache=cache, session=requests.Session())
+    with pytest.raises(fast_backoff.CircuitOpenError):
+        fast_backoff.fetch_workbook(url, cache=cache, session=requests.Session())
+    assert server.hits == fast_backoff.BREAKER_FAILURES
+
+
+def test_refresh_cycle_fans_out_over_the_pool(dashboard, monkeypatch):
+    active, peak, done = [0], [0], []
+    lock = threading.Lock()
+
+    def slow_reload(url, cache=None, session=None, force=False, interactive=True):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+            done.append(url)
+
+    monkeypatch.setattr(dashboard, "reload_unit", slow_reload)
+    monkeypatch.setattr(dashboard, "REFRESH_INTERVAL_SEC", 3600)
+    state = {"urls": {f"http://unit/{i}" for i in range(12)}, "last_cycle": None}
+    pool = dashboard.ThreadPoolExecutor(max_workers=dashboard.LOAD_WORKERS)
+    started = time.monotonic()
+    # The loop sleeps for an hour after its first cycle; the daemon thread dies with the test run
+    threading.Thread(target=dashboard._refresh_loop, args=(state, None, None, pool), daemon=True).start()
+    while state["last_cycle"] is None and time.monotonic() - started < 10:
+        time.sleep(0.01)
+    assert sorted(done) == sorted(state["urls"])
+    assert peak[0] == dashboard.LOAD_WORKERS
+    assert time.monotonic() - started < 12 * 0.2
@@ -0,0 +1,80 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+DAY = 86400
+
+
+@pytest.fixture
+def history(dashboard, tmp_path, monkeypatch):
+    monkeypatch.setattr(dashboard, "HISTORY_DIR", str(tmp_path / "history"))
+    return dashboard
+
+
+def workbook(cut_qty=10.0):
+    return pd.DataFrame({
+        "BUYER": ["ACME", "ACME", "ZED"],
+        "STATUS": ["OPEN", "CLOSED", "OPEN"],
+        "STYLE NO": ["S1", "S2", "S3"],
+        "COLOUR": ["RED", "BLUE", "RED"],
+        "END DATE": pd.to_datetime(["2026-01-10", "2026-01-20", "2026-02-05"]),
+        "CUT QTY": [cut_qty, 20.0, 30.0],
+        "FABRIC USED": [5.0, 8.0, 9.0],
+    })
+
+
+def part_files(history, month):
+    part_dir = os.path.join(history.HISTORY_DIR, "unit=UNIT_A", f"month={month}")
+    return sorted(n for n in os.listdir(part_dir) if n.endswith(".parquet"))
+
+
+def test_unchanged_partitions_are_skipped(history):
+    now = 1_780_000_000
+    history.append_history("Unit A", workbook(), now)
+    history.append_history("Unit A", workbook(), now + 60)
+    assert len(part_files(history, "2026-01")) == 1
+    # Only January's rows changed, so February keeps its single part file
+    history.append_history("Unit A", workbook(cut_qty=11.0), now + 120)
+    assert len(part_files(history, "2026-01")) == 2
+    assert len(part_files(history, "2026-02")) == 1
+
+
+def test_compaction_keeps_last_snapshot_per_day(history, monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_COMPACT_FILES", 100)
+    now = time.time() // DAY * DAY + 3600
+    snapshots = [now - 200 * DAY, now - 2 * DAY, now - 2 * DAY + 600, now, now + 60]
+    for i, at in enumerate(snapshots):
+        history.append_history("Unit A", workbook(cut_qty=float(i)), at)
+    monkeypatch.setattr(history, "HISTORY_COMPACT_FILES", 2)
+    part_dir = os.path.join(history.HISTORY_DIR, "unit=UNIT_A", "month=2026-01")
+    history.compact_partition(part_dir)
+    kept = pd.read_parquet(part_dir)["SNAPSHOT_AT"].drop_duplicates().sort_values()
+    expected = [pd.Timestamp(at, unit="s") for at in (now - 2 * DAY + 600, now + 60)]
+    assert list(kept) == expected
+
+
+def test_read_history_returns_latest_snapshot(history):
+    history.append_history("Unit A", workbook(), 1_780_000_000)
+    history.append_history("Unit A", workbook(cut_qty=12.0), 1_780_000_600)
+    hist = history.read_history(["Unit A"], ["2026-01"], ["CUT QTY"])
+    assert sorted(hist["CUT QTY"]) == [12.0, 20.0]
+
+
+def test_retention_cutoff_uses_the_snapshot_clock(history, monkeypatch):
+    # SNAPSHOT_AT is naive UTC; a local-time cutoff would drop this snapshot east of UTC
+    monkeypatch.setenv("TZ", "Pacific/Kiritimati")
+    time.tzset()
+    try:
+        monkeypatch.setattr(history, "HISTORY_COMPACT_FILES", 100)
+        inside = time.time() - history.HISTORY_RETENTION_DAYS * DAY + 6 * 3600
+        history.append_history("Unit A", workbook(cut_qty=1.0), inside)
+        history.append_history("Unit A", workbook(cut_qty=2.0), time.time())
+        monkeypatch.setattr(history, "HISTORY_COMPACT_FILES", 2)
+        part_dir = os.path.join(history.HISTORY_DIR, "unit=UNIT_A", "month=2026-01")
+        history.compact_partition(part_dir)
+        assert pd.read_parquet(part_dir)["SNAPSHOT_AT"].nunique() == 2
+    finally:
+        monkeypatch.undo()
+        time.tzset()
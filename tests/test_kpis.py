@@ -0,0 +1,115 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+BUYERS = ["ZARA", "H&M", "GAP", "NEXT", "M&S"]
+STATUSES = ["OPEN", "CLOSED", "HOLD"]
+
+
+def make_frame(dashboard, n, seed=7):
+    """A parsed-looking workbook frame with random quantities and percentages."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({c: rng.uniform(0, 500, n).round(2) for c in dashboard.NUM_COLS})
+    df['CAN CUT %'] = rng.uniform(0.8, 1.1, n)
+    df['CUT %'] = rng.uniform(0.7, 1.1, n)
+    df['CAD Cons'] = rng.uniform(0.8, 1.6, n)
+    df['BUYER'] = rng.choice(BUYERS, n)
+    df['STATUS'] = rng.choice(STATUSES, n)
+    df['STYLE NO'] = [f"ST{i:04d}" for i in rng.integers(0, max(n // 4, 1), n)]
+    df['COLOUR'] = rng.choice(["RED", "NAVY"], n)
+    df['END DATE'] = pd.Timestamp("2025-11-01") + pd.to_timedelta(rng.integers(0, 120, n), unit="D")
+    df['MONTH_STR'] = df['END DATE'].dt.strftime('%b-%y').str.upper()
+    df['WEEK_FMT'] = dashboard.week_labels(df['END DATE'])
+    for c in dashboard.DIM_COLS:
+        df[c] = df[c].astype('category')
+    return df
+
+
+def row_level_kpis(dff):
+    """The card formulas as they were computed straight from the filtered rows."""
+    sum_cut, sum_cancut, sum_ord = dff['CUT QTY'].sum(), dff['CAN CUT QTY'].sum(), dff['ORD QTY'].sum()
+    sum_req, sum_rcvd, sum_used = dff['FAB Req'].sum(), dff['FAB RCVD'].sum(), dff['FABRIC USED'].sum()
+    avg_std = (sum_req / sum_ord) if sum_ord > 0 else 0
+    avg_ach = (sum_used / sum_cut) if sum_cut > 0 else 0
+    return {
+        'sum_ord': sum_ord, 'sum_cancut': sum_cancut, 'sum_cut': sum_cut, 'sum_req': sum_req,
+        'sum_rcvd': sum_rcvd, 'sum_used': sum_used, 'sum_stock': dff['FABRIC LEFTOVER STOCK'].sum(),
+        'avg_std': avg_std,
+        'avg_cad': ((dff['CAD Cons'] * dff['ORD QTY']).sum() / sum_ord) if sum_ord > 0 else 0,
+        'avg_ach': avg_ach,
+        'avg_cancut_p': dff['CAN CUT %'].mean() * 100 if not dff.empty else 0,
+        'avg_cut_p': dff['CUT %'].mean() * 100 if not dff.empty else 0,
+        'perf_cut': (sum_cut / sum_cancut * 100) if sum_cancut > 0 else 0,
+        'perf_rcvd': (sum_rcvd / sum_req * 100) if sum_req > 0 else 0,
+        'perf_cons': avg_ach - avg_std,
+        'ex_counts': {
+            'ex1': len(dff[dff['CUT %'] < 1]),
+            'ex2': len(dff[(dff['CAN CUT %'] < 1.01) & (dff['CUT %'] < 1.01)]),
+            'ex3': len(dff[(dff['CUT %'] < dff['CAN CUT %']) & (dff['CUT %'] < 1.01)]),
+        },
+    }
+
+
+def selection(dashboard, df, filters):
+    """The dashboard's path for one selection: cube totals plus an index row mask."""
+    dataset = {"df": df, **dashboard.build_derived(df)}
+    row_mask = None
+    for dim, selected in zip(['MONTH_STR', 'BUYER', 'STATUS', 'STYLE NO'], filters):
+        if selected:
+            row_mask = dashboard.index_mask(dataset["filter_index"], dim, selected, row_mask)
+    return dataset, row_mask
+
+
+def row_filter(df, filters):
+    dff = df
+    for dim, selected in zip(['MONTH_STR', 'BUYER', 'STATUS', 'STYLE NO'], filters):
+        if selected:
+            dff = dff[dff[dim].isin(selected)]
+    return dff
+
+
+FILTERS = [
+    (None, None, None, None),
+    (["DEC-25"], None, None, None),
+    (["NOV-25", "JAN-26"], ["ZARA", "GAP"], None, None),
+    (None, ["H&M"], ["OPEN"], None),
+    (["FEB-26"], None, ["CLOSED"], ["ST0001", "ST0002", "ST0003"]),
+    (["DEC-25"], ["NOBODY"], None, None),
+]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_compute_kpis_matches_row_level_formulas(dashboard, filters):
+    df = make_frame(dashboard, 2000)
+    dataset, row_mask = selection(dashboard, df, filters)
+    totals = dashboard.selected_cube(dataset, filters, row_mask).sum(numeric_only=True)
+    kpis = dashboard.compute_kpis(totals, df, row_mask)
+    expected = row_level_kpis(row_filter(df, filters))
+    assert kpis['ex_counts'] == expected.pop('ex_counts')
+    for name, value in expected.items():
+        assert kpis[name] == pytest.approx(value, rel=1e-9, abs=1e-9), name
+
+
+@pytest.mark.skipif(not os.environ.get("FCR_BENCH"), reason="benchmark; set FCR_BENCH=1 to run")
+def test_compute_kpis_benchmark(dashboard):
+    df = make_frame(dashboard, 200_000)
+    filters = (["DEC-25", "JAN-26"], ["ZARA", "GAP", "NEXT"], ["OPEN"], None)
+    dataset, row_mask = selection(dashboard, df, filters)
+
+    def best_of(fn, repeat=5):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    cube_sec = best_of(lambda: dashboard.compute_kpis(
+        dashboard.selected_cube(dataset, filters, row_mask).sum(numeric_only=True), df, row_mask))
+    rows_sec = best_of(lambda: row_level_kpis(row_filter(df, filters)))
+    # Reported, not asserted: wall-clock comparisons flip on busy machines
+    print(f"compute_kpis {cube_sec * 1000:.1f} ms, row-level {rows_sec * 1000:.1f} ms "
+          f"(200k rows, {len(dataset['cube'])} cube rows)")
@@ -0,0 +1,75 @@
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+HEADER = ['SL NO', 'BUYER', 'STYLE NO', 'COLOUR', 'MERCHANT', 'ORD QTY', 'CAN CUT QTY', 'CUT QTY',
+          'FAB Req', 'FAB RCVD', 'FABRIC USED', 'FABRIC LEFTOVER STOCK', 'STD Cons', 'CAD Cons',
+          'ACHIEVED CONS', 'CAN CUT %', 'CUT %', 'END DATE', 'STATUS', 'REMARKS', 'NOTES']
+
+
+def make_workbook(rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(HEADER)
+    for row in rows:
+        ws.append(row)
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def row(i, style, end_date, status="OPEN", cut=90, remarks=None):
+    cut_pct = cut / 100 if isinstance(cut, int) else cut
+    return [i, "ZARA" if i % 2 else "H&M", style, "NAVY", "ANU", 100 + i, 95, cut, 120.5, 118,
+            110.25, 7.75, 1.2, 1.15, 1.22, 0.95, cut_pct, end_date, status, remarks, "internal"]
+
+
+WORKBOOKS = {
+    "plain": [row(i, f"ST{i:03d}", datetime(2026, 1 + i % 3, 5 + i)) for i in range(12)],
+    "mixed cells": [
+        row(1, 40123, datetime(2026, 3, 1)),            # numeric style number
+        row(2, "40123A", "15/03/2026"),                 # day-first date typed as text
+        row(3, None, None, status=None),                # blank dimensions and date
+        row(4, "ST4", datetime(2026, 4, 2), cut="n/a", remarks="fabric short"),
+        row(5, "ST5", "not a date", cut=None),
+    ],
+    "empty": [],
+}
+
+
+@pytest.fixture
+def full_sheet(dashboard, monkeypatch):
+    """parse_workbook as it was before column projection: whole sheet through openpyxl, then trimmed."""
+    read_excel = pd.read_excel
+
+    def read_whole_sheet(io, engine=None, usecols=None):
+        df = read_excel(io, engine="openpyxl")
+        return df[[c for c in df.columns if usecols(c)]]
+
+    def parse(content):
+        with monkeypatch.context() as m:
+            m.setattr(pd, "read_excel", read_whole_sheet)
+            return dashboard.parse_workbook(content)
+    return parse
+
+
+@pytest.mark.parametrize("name", list(WORKBOOKS))
+def test_projected_openpyxl_matches_full_sheet(dashboard, full_sheet, name):
+    content = make_workbook(WORKBOOKS[name])
+    pd.testing.assert_frame_equal(dashboard.parse_workbook(content, "openpyxl"), full_sheet(content))
+
+
+@pytest.mark.parametrize("name", list(WORKBOOKS))
+def test_calamine_matches_full_sheet(dashboard, full_sheet, name):
+    pytest.importorskip("python_calamine")
+    content = make_workbook(WORKBOOKS[name])
+    pd.testing.assert_frame_equal(dashboard.parse_workbook(content, "calamine"), full_sheet(content))
+
+
+def test_unused_columns_are_not_kept(dashboard):
+    df = dashboard.parse_workbook(make_workbook(WORKBOOKS["plain"]))
+    assert not {'SL NO', 'MERCHANT', 'NOTES'} & set(df.columns)
+    assert set(dashboard.REQUIRED_COLS) <= set(df.columns)
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+import requests
+
+from conftest import fresh_cache, url_of
+from test_parse import make_workbook, row
+
+
+@pytest.fixture
+def shared(dashboard, tmp_path):
+    return dashboard.SQLiteSharedCache(str(tmp_path / "shared.db"))
+
+
+@pytest.fixture
+def workbook_server(server):
+    server.body = make_workbook([row(i, f"ST{i}", datetime(2026, 1, 5 + i)) for i in range(4)])
+    return server
+
+
+def fetch(dashboard, url, cache, force=False):
+    return dashboard.fetch_workbook(url, cache=cache, session=requests.Session(), force=force)
+
+
+def test_version_only_moves_when_bytes_change(shared):
+    url = "http://unit/a.xlsx"
+    assert shared.put(url, b"one", "sha-one", {"etag": "e1"}, 100.0) == 1
+    assert shared.put(url, b"one", "sha-one", {"etag": "e2"}, 200.0) == 1
+    assert shared.touch(url, 300.0) == 1
+    assert shared.put(url, b"two", "sha-two", {}, 400.0) == 2
+    record = shared.get(url)
+    assert (record["sha256"], record["fetched_at"], record["content"]) == ("sha-two", 400.0, b"two")
+    assert shared.touch("http://unit/unknown.xlsx", 500.0) is None
+
+
+def test_own_record_is_not_reused(dashboard, shared, workbook_server):
+    cache = fresh_cache(dashboard, shared)
+    url = url_of(workbook_server)
+    fetch(dashboard, url, cache)
+    # The shared record is our own download, so a refresh still asks the server
+    fetch(dashboard, url, cache)
+    assert workbook_server.hits == 2
+
+
+def test_fresh_record_serves_a_second_cache_without_a_request(dashboard, shared, workbook_server):
+    url = url_of(workbook_server)
+    first = fetch(dashboard, url, fresh_cache(dashboard, shared))
+    other = fresh_cache(dashboard, shared)
+    second = fetch(dashboard, url, other)
+    assert workbook_server.hits == 1
+    pd.testing.assert_frame_equal(first, second)
+    assert other["entries"][url]["version"] == 1
+
+
+def test_forced_refresh_reaches_the_server(dashboard, shared, workbook_server):
+    url = url_of(workbook_server)
+    fetch(dashboard, url, fresh_cache(dashboard, shared))
+    fetch(dashboard, url, fresh_cache(dashboard, shared), force=True)
+    assert workbook_server.hits == 2
@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+from conftest import DASHBOARD
+
+# Wall-clock budget for rendering the login view on a cold process
+STARTUP_BUDGET_SEC = float(os.environ.get("FCR_STARTUP_BUDGET", "5"))
+HEAVY_MODULES = ["plotly", "firebase_admin"]
+
+# Runs in a fresh interpreter so modules imported by other tests can't hide a regression.
+# Streamlit itself imports part of plotly (for its chart theme), so only modules beyond
+# what was loaded before the script ran count.
+SCRIPT = textwrap.dedent("""
+    import json, sys, time
+    from streamlit.testing.v1 import AppTest
+
+    def heavy():
+        return {m for m in sys.modules if m.split(".")[0] in sys.argv[2:]}
+
+    preloaded = heavy()
+    at = AppTest.from_file(sys.argv[1], default_timeout=60)
+    at.session_state["show_login"] = True
+    started = time.perf_counter()
+    at.run()
+    print(json.dumps({
+        "seconds": time.perf_counter() - started,
+        "exceptions": [e.message for e in at.exception],
+        "forms": len(at.get("form")),
+        "loaded": sorted(heavy() - preloaded),
+    }))
+""")
+
+
+def test_login_view_is_fast_and_skips_heavy_imports(tmp_path):
+    # Units point at a closed local port so the background prewarm fails fast and offline
+    config_dir = tmp_path / ".fcr_cache"
+    config_dir.mkdir()
+    unit = {"dashboard_url": "http://127.0.0.1:9/unit.xlsx", "excel_url": ""}
+    (config_dir / "unit_config.json").write_text(json.dumps({"UNIT A": unit, "UNIT B": unit}))
+    env = {**os.environ, "HOME": str(tmp_path)}
+
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT, DASHBOARD, *HEAVY_MODULES],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert out.returncode == 0, out.stderr
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    assert result["exceptions"] == []
+    assert result["forms"] == 1
+    assert result["loaded"] == []
+    assert result["seconds"] < STARTUP_BUDGET_SEC
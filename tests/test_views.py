@@ -0,0 +1,76 @@
+import functools
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+from datetime import datetime
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import DASHBOARD
+from test_parse import make_workbook, row
+
+# Drives the main view in a fresh interpreter; Streamlit's process-wide caches stay isolated
+SCRIPT = textwrap.dedent("""
+    import json, sys
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(sys.argv[1], default_timeout=60)
+    steps = []
+
+    def record(name):
+        steps.append({
+            "step": name,
+            "exceptions": [e.message for e in at.exception],
+            "view": at.session_state["active_exception_view"],
+            "close_button": any("Close Details" in b.label for b in at.button),
+        })
+
+    at.run()
+    record("load")
+    at.button(key="btn_ex1").click().run()
+    record("open")
+    next(b for b in at.button if "Close Details" in b.label).click().run()
+    record("close")
+    print(json.dumps(steps))
+""")
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def workbook_server(tmp_path):
+    www = tmp_path / "www"
+    www.mkdir()
+    today = datetime.now()
+    rows = [row(i, f"ST{i}", today, cut=80 + i * 5) for i in range(6)]
+    (www / "unit.xlsx").write_bytes(make_workbook(rows))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(www)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/unit.xlsx"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_exception_details_open_and_close(tmp_path, workbook_server):
+    config_dir = tmp_path / ".fcr_cache"
+    config_dir.mkdir()
+    config = {"UNIT A": {"dashboard_url": workbook_server, "excel_url": ""}}
+    (config_dir / "unit_config.json").write_text(json.dumps(config))
+    env = {**os.environ, "HOME": str(tmp_path), "FCR_SHARED_CACHE": "none"}
+
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT, DASHBOARD],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert out.returncode == 0, out.stderr
+    load, opened, closed = json.loads(out.stdout.strip().splitlines()[-1])
+    assert load == {"step": "load", "exceptions": [], "view": None, "close_button": False}
+    assert opened == {"step": "open", "exceptions": [], "view": "ex1", "close_button": True}
+    assert closed == {"step": "close", "exceptions": [], "view": None, "close_button": False}